@@ -1,22 +1,101 @@
 from flask import Flask
-from routes.query import query_bp
-from routes.generate import generate_bp
+from routes.query import query_bp, query_parser
+from routes.generate import generate_bp, report_generator
 from routes.history import history_bp
 from routes.download import download_bp
+from routes.metrics import metrics_bp
+from routes.batch import batch_bp
 from flask_cors import CORS
+import multiprocessing
 import os
+import sys
+import threading
 
-app = Flask(__name__)
-CORS(app)
-app.config["DEBUG"] = True 
-app.register_blueprint(query_bp)
-app.register_blueprint(generate_bp)
-app.register_blueprint(history_bp)
-app.register_blueprint(download_bp)
-
-@app.route("/", methods=["GET", "HEAD"])
-def health_check():
-    return "OK", 200
+def create_app(warm_up_in_background=None):
+    """
+    Builds the Flask app. Controllers are built lazily; unless disabled (WARMUP=0),
+    a background thread builds them right away.
+    """
+    app = Flask(__name__)
+    CORS(app)
+    app.config["DEBUG"] = True 
+    app.register_blueprint(query_bp)
+    app.register_blueprint(generate_bp)
+    app.register_blueprint(history_bp)
+    app.register_blueprint(download_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(batch_bp)
+
+    @app.route("/", methods=["GET", "HEAD"])
+    def health_check():
+        return "OK", 200
+
+    @app.route("/ready", methods=["GET", "HEAD"])
+    def readiness_check():
+        handlers = query_parser.get().response.handlers.values() if query_parser.loaded else []
+        if report_generator.loaded and handlers and all(handler.loaded for handler in handlers):
+            return "OK", 200
+        return "Warming up", 503
+
+    if warm_up_in_background is None:
+        warm_up_in_background = os.environ.get("WARMUP", "1") == "1"
+    if warm_up_in_background:
+        start_warm_up()
+    return app
+
+
+def warm_up():
+    """
+    Builds the controllers in the background, so the health check answers immediately
+    and the first requests do not pay for imports and index loading.
+    """
+    try:
+        query_parser.get().response.warm_up()
+        report_generator.get()
+        print("Warm-up complete")
+
+        from services.news_digest import start_news_refresher
+        start_news_refresher(query_parser.get().response.news_summariser)
+    except Exception as e:
+        # The controllers are built again on first use
+        print(f"Warm-up failed: {e}")
+
+
+def start_warm_up():
+    # Spawned children (the export render pool) render files and need no controllers. They re-import the
+    # parent's main module as __mp_main__ before parent_process() is set; in any other process the two names
+    # are the same module
+    if multiprocessing.parent_process() is not None or sys.modules.get("__mp_main__", sys.modules["__main__"]) is not sys.modules["__main__"]:
+        return
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
+def preload_shared_assets():
+    """
+    Loads read-only assets in a pre-fork master (see gunicorn.conf.py) so all workers share
+    the pages: the controller modules with their libraries and prompt templates, and the
+    glossary index. No network clients are created here.
+    """
+    import controllers.help, controllers.error, controllers.query_parser
+    import controllers.clarification, controllers.news_summariser, controllers.report_generator
+    from services.glossary_index import preload_glossary_db
+    try:
+        preload_glossary_db()
+    except Exception as e:
+        print(f"Glossary preload failed, workers will load it on first use: {e}")
+
+
+def reinit_after_fork():
+    """
+    Drops network clients inherited from the master; workers create their own on first use.
+    """
+    from services.glossary_index import reset_glossary_clients
+    reset_glossary_clients()
+    query_parser.reset()
+    report_generator.reset()
+
+
+app = create_app()
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
@@ -0,0 +1,143 @@
+"""
+Benchmark of services.data_parser against the previous regex implementation.
+
+Runs both parsers over the recorded model outputs in benchmarks/fixtures/model_outputs.json,
+plus synthetic long outputs, and reports how many outputs each one parses and the time per call.
+
+    python -m benchmarks.bench_data_parser
+    python -m benchmarks.bench_data_parser --repeat 2000
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.data_parser import parse_json, parse_list
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "model_outputs.json")
+
+
+def legacy_parse_json(raw_output):
+    """
+    The regex implementation parse_json replaced, kept verbatim for comparison.
+    """
+    cleaned = raw_output.strip()
+    cleaned = re.sub(r"```json(.*?)```", r"\1", cleaned, flags=re.DOTALL | re.IGNORECASE)
+    cleaned = re.sub(r"```(.*?)```", r"\1", cleaned, flags=re.DOTALL)
+    cleaned = re.sub(r"#+\s*json\s*", "", cleaned, flags=re.IGNORECASE)
+    cleaned = re.sub(r"#+", "", cleaned)
+    cleaned = re.sub(r"'''json(.*?)'''", r"\1", cleaned, flags=re.DOTALL | re.IGNORECASE)
+    cleaned = re.sub(r"'''(.*?)'''", r"\1", cleaned, flags=re.DOTALL)
+    cleaned = cleaned.strip()
+
+    match = re.search(r"\{.*\}", cleaned, flags=re.DOTALL)
+    if match:
+        cleaned = match.group(0)
+
+    try:
+        return json.loads(cleaned)
+    except Exception:
+        fixed = cleaned.replace("'", '"')
+        fixed = re.sub(r",\s*}", "}", fixed)
+        fixed = re.sub(r",\s*]", "]", fixed)
+        try:
+            return json.loads(fixed)
+        except Exception:
+            return None
+
+
+def legacy_parse_list(raw_output):
+    """
+    The regex implementation parse_list replaced, kept verbatim for comparison.
+    """
+    import ast
+    cleaned = raw_output.strip()
+    cleaned = re.sub(r"```python(.*?)```", r"\1", cleaned, flags=re.DOTALL | re.IGNORECASE)
+    cleaned = re.sub(r"```(.*?)```", r"\1", cleaned, flags=re.DOTALL)
+    cleaned = re.sub(r"'''python(.*?)'''", r"\1", cleaned, flags=re.DOTALL | re.IGNORECASE)
+    cleaned = re.sub(r"'''(.*?)'''", r"\1", cleaned, flags=re.DOTALL)
+    cleaned = re.sub(r"#+\s*python\s*", "", cleaned, flags=re.IGNORECASE)
+    cleaned = re.sub(r"#+", "", cleaned)
+    cleaned = cleaned.strip()
+
+    match = re.search(r"\[.*\]", cleaned, flags=re.DOTALL)
+    if match:
+        cleaned = match.group(0)
+
+    try:
+        return json.loads(cleaned)
+    except Exception:
+        try:
+            result = ast.literal_eval(cleaned)
+            if isinstance(result, list):
+                return result
+        except Exception:
+            return
+
+
+PARSERS = {
+    "json": {"legacy": legacy_parse_json, "current": parse_json},
+    "list": {"legacy": legacy_parse_list, "current": parse_list},
+}
+
+
+def synthetic_outputs(size):
+    """
+    Long outputs: a large valid report JSON, and a truncated one full of opening braces,
+    which sends the greedy DOTALL regex into quadratic backtracking.
+    """
+    sections = {f"section_{i}": {"title": f"Section {i}", "body": "Revenue {grew} " * 20} for i in range(size // 400)}
+    report = "Here is the report:\n```json\n" + json.dumps({"sections": sections}) + "\n```"
+    truncated = "```json\n" + "{\"a\": " * (size // 6)
+    return [
+        {"kind": "json", "name": f"report_{len(report) // 1000}kb", "text": report},
+        {"kind": "json", "name": f"truncated_{len(truncated) // 1000}kb", "text": truncated},
+    ]
+
+
+def time_call(parser, text, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parser(text)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="data_parser benchmark")
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--repeat", type=int, default=500, help="Calls per corpus entry")
+    parser.add_argument("--size", type=int, default=20000, help="Approximate size of the synthetic outputs in characters")
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    parsed = {"legacy": 0, "current": 0}
+    elapsed = {"legacy": 0.0, "current": 0.0}
+    print(f"{'#':>3}  {'kind':<5}{'legacy':>8}{'current':>9}{'legacy us':>12}{'current us':>12}")
+    for i, entry in enumerate(corpus):
+        row = []
+        for name, fn in PARSERS[entry["kind"]].items():
+            ok = fn(entry["text"]) is not None
+            us = time_call(fn, entry["text"], args.repeat)
+            parsed[name] += ok
+            elapsed[name] += us
+            row.append((ok, us))
+        (legacy_ok, legacy_us), (current_ok, current_us) = row
+        print(f"{i:>3}  {entry['kind']:<5}{'ok' if legacy_ok else '-':>8}{'ok' if current_ok else '-':>9}{legacy_us:>12.1f}{current_us:>12.1f}")
+
+    print(f"\nParsed: legacy {parsed['legacy']}/{len(corpus)}, current {parsed['current']}/{len(corpus)}")
+    print(f"Mean per call: legacy {elapsed['legacy'] / len(corpus):.1f} us, current {elapsed['current'] / len(corpus):.1f} us")
+
+    print("\nSynthetic long outputs:")
+    for entry in synthetic_outputs(args.size):
+        timings = {name: time_call(fn, entry["text"], 1) / 1000 for name, fn in PARSERS[entry["kind"]].items()}
+        print(f"  {entry['name']:<18} legacy {timings['legacy']:>9.1f} ms   current {timings['current']:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Local stand-ins for every upstream the request pipeline calls, replaying recorded responses
+from benchmarks/fixtures/recorded.json with configurable latency:
+- Gemini through google-genai (services.llm) and through langchain (ChatGoogleGenerativeAI)
+- Google embeddings for the glossary index and the semantic answer cache
+- Tavily, DuckDuckGo, Yahoo ticker search, yfinance and page downloads
+Nothing here touches the network or needs API keys.
+"""
+import re
+import json
+import time
+import hashlib
+import threading
+from operator import itemgetter
+from collections import Counter
+from contextlib import ExitStack
+from types import SimpleNamespace
+from typing import Any, List, Optional, Tuple
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.runnables import RunnablePassthrough
+from pydantic import BaseModel
+
+from services.streaming import current_sink
+
+
+class Recorder:
+    """
+    Holds the fixture, the latency scale and per-provider call counts.
+    """
+
+    def __init__(self, fixture_path: str, latency_scale: float = 1.0):
+        with open(fixture_path, encoding="utf-8") as f:
+            self.fixture = json.load(f)
+        self.latency_scale = latency_scale
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    def call(self, provider: str):
+        with self._lock:
+            self.calls[provider] += 1
+        time.sleep(self.fixture["latency_ms"].get(provider, 0) * self.latency_scale / 1000)
+
+    def llm_response(self, prompt: str, message: str = None) -> str:
+        self.call("gemini")
+        for rule in self.fixture["llm"]:
+            if not re.search(rule["match"], prompt):
+                continue
+            for sub_rule in rule.get("by_message", []):
+                if re.search(sub_rule["match"], message if message is not None else prompt):
+                    return sub_rule["response"]
+            if "response" in rule:
+                return rule["response"]
+        return ""
+
+    def page(self, url: str) -> str:
+        self.call("http")
+        return self.fixture["http"].get(url, self.fixture["http"]["default"])
+
+
+recorder: Recorder = None
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Drop-in for ChatGoogleGenerativeAI: answers from the recorded LLM rules.
+    """
+
+    model: str = "fake-gemini"
+    temperature: float = 0
+    max_output_tokens: Optional[int] = None
+    stream_to_sink: bool = False
+    withhold: Tuple[str, ...] = ()
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gemini"
+
+    def get_num_tokens(self, text: str) -> int:
+        return len(text) // 4
+
+    def with_structured_output(self, schema, method="json_mode", *, include_raw=False, **kwargs: Any):
+        # Same shape as ChatGoogleGenerativeAI's json_mode: bind the schema, parse the reply with pydantic
+        parser = PydanticOutputParser(pydantic_object=schema)
+        llm = self.bind(response_mime_type="application/json", response_schema=schema.model_json_schema())
+        if not include_raw:
+            return llm | parser
+        return {"raw": llm} | RunnablePassthrough.assign(
+            parsed=itemgetter("raw") | parser, parsing_error=lambda _: None
+        ).with_fallbacks([RunnablePassthrough.assign(parsed=lambda _: None)], exception_key="parsing_error")
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        text = recorder.llm_response(prompt)
+        sink = current_sink()
+        if self.stream_to_sink and sink is not None:
+            # Mirror services.chat_model.ChatModel: write the answer to the sink word by word
+            writer = sink.writer(self.withhold)
+            for word in re.findall(r"\S+\s*", text):
+                writer.write(word)
+            writer.finish()
+        usage = {"input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4, "total_tokens": (len(prompt) + len(text)) // 4}
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=usage))])
+
+
+class FakeGenAIClient:
+    """
+    Drop-in for google.genai.Client as used by services.llm.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.models = self
+
+    def _respond(self, contents, config):
+        system = getattr(config, "system_instruction", "") or ""
+        message = contents[-1] if contents else ""
+        text = recorder.llm_response(system + "\n" + "\n".join(map(str, contents)), message)
+        usage = SimpleNamespace(prompt_token_count=len(system) // 4, candidates_token_count=len(text) // 4)
+        return SimpleNamespace(text=text, usage_metadata=usage, parsed=self._parse(text, getattr(config, "response_schema", None)))
+
+    def _parse(self, text, schema):
+        # Like the SDK, fill response.parsed when the config carries a pydantic response schema
+        if not isinstance(schema, type) or not issubclass(schema, BaseModel):
+            return None
+        try:
+            return schema.model_validate_json(text)
+        except ValueError:
+            return None
+
+    def generate_content(self, model=None, contents=None, config=None):
+        return self._respond(contents, config)
+
+    def generate_content_stream(self, model=None, contents=None, config=None):
+        response = self._respond(contents, config)
+        for word in re.findall(r"\S+\s*", response.text):
+            yield SimpleNamespace(text=word, usage_metadata=None)
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic unit vectors derived from the text hash.
+    """
+
+    def __init__(self, size: int = 64):
+        self.size = size
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+        vector = np.random.default_rng(seed).normal(size=self.size)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        recorder.call("embeddings")
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        recorder.call("embeddings")
+        return self._vector(text)
+
+
+class FakeTavily:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def run(self, query, *args, **kwargs):
+        recorder.call("tavily")
+        return [dict(item) for item in recorder.fixture["tavily"]]
+
+    invoke = run
+
+
+class FakeDuckDuckGo:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def run(self, query, *args, **kwargs):
+        recorder.call("duckduckgo")
+        return recorder.fixture["duckduckgo"]
+
+    invoke = run
+
+
+class FakeTicker:
+    def __init__(self, ticker):
+        self.ticker = ticker
+
+    @property
+    def info(self):
+        recorder.call("yfinance")
+        return dict(recorder.fixture["yfinance"]["info"], symbol=self.ticker)
+
+    def history(self, *args, **kwargs):
+        recorder.call("yfinance")
+        rows = recorder.fixture["yfinance"]["history"]
+        index = pd.to_datetime([row["date"] for row in rows])
+        return pd.DataFrame([{k: v for k, v in row.items() if k != "date"} for row in rows], index=index)
+
+
+class FakeResponse:
+    def __init__(self, url: str, text: str, content_type: str = "text/html; charset=utf-8", payload=None):
+        self.url = url
+        self.status_code = 200
+        self.text = text
+        self.content = text.encode("utf-8")
+        self.encoding = "utf-8"
+        self.headers = {"Content-Type": content_type, "Content-Length": str(len(self.content))}
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1, decode_unicode=False):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def fake_requests_get(url, *args, **kwargs):
+    if "finance.yahoo.com/v1/finance/search" in url:
+        recorder.call("yahoo_search")
+        payload = recorder.fixture["yahoo_search"]
+        return FakeResponse(url, json.dumps(payload), "application/json", payload)
+    return FakeResponse(url, recorder.page(url))
+
+
+def build_glossary_db():
+    from langchain_community.vectorstores import FAISS
+    return FAISS.from_texts(recorder.fixture["glossary"], FakeEmbeddings())
+
+
+def install(stack: ExitStack, active: Recorder):
+    """
+    Patches every upstream client for as long as the stack is open.
+    Controllers must be constructed inside the stack, since tools bind their clients at build time.
+    """
+    global recorder
+    recorder = active
+
+    patches = [
+        mock.patch("google.genai.Client", FakeGenAIClient),
+        mock.patch("requests.get", fake_requests_get),
+        mock.patch("langchain_google_genai.ChatGoogleGenerativeAI", FakeChatModel),
+        mock.patch("controllers.clarification.ChatGoogleGenerativeAI", FakeChatModel),
+        mock.patch("controllers.clarification.ChatModel", FakeChatModel),
+        mock.patch("controllers.news_summariser.ChatModel", FakeChatModel),
+        mock.patch("controllers.news_summariser.ChatGoogleGenerativeAI", FakeChatModel),
+        mock.patch("controllers.news_summariser.TavilySearchResults", FakeTavily),
+        mock.patch("controllers.report_generator.ChatGoogleGenerativeAI", FakeChatModel),
+        mock.patch("controllers.report_generator.TavilySearchResults", FakeTavily),
+        mock.patch("services.agents.DuckDuckGoSearchResults", FakeDuckDuckGo),
+        mock.patch("services.agents.yf", SimpleNamespace(Ticker=FakeTicker)),
+        mock.patch("services.glossary_index._glossary_db", None),
+        mock.patch("services.glossary_index.GoogleGenerativeAIEmbeddings", lambda *args, **kwargs: FakeEmbeddings()),
+    ]
+    for patch in patches:
+        stack.enter_context(patch)
+
+    import services.glossary_index
+    services.glossary_index._glossary_db = build_glossary_db()
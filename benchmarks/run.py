@@ -0,0 +1,128 @@
+"""
+Offline benchmark of the full request pipeline.
+
+Replays recorded upstream responses (see benchmarks/fakes.py) through
+QueryParser.handle_query, NewsSummary.handle_news_summary, ReportGenerator.generate_report and
+ReportGenerator.generate_reports (bulk), and reports p50/p95 latency, upstream call counts per
+request and peak traced memory.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --scenario query --iterations 20 --latency-scale 0.1 --cold
+    python -m benchmarks.run --json bench.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import ExitStack
+
+import numpy as np
+
+# Caches and API keys must be set up before any controller module is imported
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="insightz-bench-"))
+for key in ("GOOGLE_API_KEY", "GEMINI_API_KEY", "TAVILY_API_KEY"):
+    os.environ.setdefault(key, "benchmark")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import fakes
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "recorded.json")
+SCENARIOS = ("query", "news", "report", "bulk_report")
+
+
+def reset_caches():
+    """
+    Clears in-process caches so every iteration measures the uncached path.
+    """
+    from controllers.clarification import concept_cache
+    from services.semantic_cache import get_semantic_cache
+    concept_cache.clear()
+    get_semantic_cache().clear()
+
+
+def build_runners(recorder):
+    """
+    Constructs the controllers once and returns {scenario: [callables]}.
+    """
+    from controllers.query_parser import QueryParser
+    from controllers.news_summariser import NewsSummary
+    from controllers.report_generator import ReportGenerator
+
+    query_parser = QueryParser()
+    query_parser.response.warm_up()
+    news_summary = NewsSummary()
+    report_generator = ReportGenerator()
+
+    scenarios = recorder.fixture["scenarios"]
+    return {
+        "query": [lambda m=messages: query_parser.handle_query([dict(x) for x in m], {}) for messages in scenarios["query"]],
+        "news": [lambda h=history, q=query: news_summary.handle_news_summary(list(h), q) for history, query in scenarios["news"]],
+        "report": [lambda s=summary: report_generator.generate_report(dict(s)) for summary in scenarios["report"]],
+        "bulk_report": [lambda s=summaries: report_generator.generate_reports([dict(x) for x in s]) for summaries in scenarios["bulk_report"]],
+    }
+
+
+def run_scenario(name, runners, recorder, iterations, cold):
+    latencies = []
+    recorder.calls.clear()
+    tracemalloc.start()
+    for _ in range(iterations):
+        for runner in runners:
+            if cold:
+                reset_caches()
+            start = time.perf_counter()
+            runner()
+            latencies.append((time.perf_counter() - start) * 1000)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    requests = len(latencies)
+    return {
+        "scenario": name,
+        "requests": requests,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "mean_ms": float(np.mean(latencies)),
+        "peak_memory_mb": peak / 1e6,
+        "calls_per_request": {provider: count / requests for provider, count in sorted(recorder.calls.items())},
+    }
+
+
+def print_results(results):
+    print(f"{'scenario':<10}{'requests':>10}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}{'peak MB':>10}  calls/request")
+    for r in results:
+        calls = ", ".join(f"{provider}={count:.1f}" for provider, count in r["calls_per_request"].items())
+        print(f"{r['scenario']:<10}{r['requests']:>10}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['mean_ms']:>10.1f}{r['peak_memory_mb']:>10.1f}  {calls}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline request pipeline benchmark")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier for recorded upstream latencies")
+    parser.add_argument("--cold", action="store_true", help="Clear in-process caches before every request")
+    parser.add_argument("--fixture", default=FIXTURE)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    recorder = fakes.Recorder(args.fixture, args.latency_scale)
+    with ExitStack() as stack:
+        fakes.install(stack, recorder)
+        start = time.perf_counter()
+        runners = build_runners(recorder)
+        print(f"Controllers built in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        names = SCENARIOS if args.scenario == "all" else (args.scenario,)
+        results = [run_scenario(name, runners[name], recorder, args.iterations, args.cold) for name in names]
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import re
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_google_genai.embeddings import GoogleGenerativeAIEmbeddings
 from langchain.vectorstores import FAISS
@@ -9,15 +10,21 @@ from langchain.agents import Tool, initialize_agent, AgentType
 from dotenv import load_dotenv
 from services.contextualize_user_query import contextualize_user_query
 from utils.load_google_credentials import setup_google_credentials
-from services.agents import build_search_agent
+from services.callbacks import install_callbacks
+from services.chat_model import ChatModel
+from services.rate_limit import chat_rate_limiter
+from services.agents import build_search_agent, run_search_agent, AgentPolicy
+from services.cache import LRUCache
+from services.glossary_index import get_glossary_db
 
 load_dotenv()
 setup_google_credentials()
+install_callbacks()
 
 
-# Load glossary vector DB with Google embeddings
+# Glossary vector DB with Google embeddings, loaded once per process
 def load_vector_db():
-    return FAISS.load_local("./assets/glossary_index", GoogleGenerativeAIEmbeddings(model="models/embedding-001"), allow_dangerous_deserialization=True)
+    return get_glossary_db()
 
 
 def define_user_query(query):
@@ -31,6 +38,27 @@ def define_user_query(query):
         If the answer is not in the glossary context, respond only with 'No', nothing else. Do not make up answers or guess. Keep your response concise and to the point. \n\n
         """
 
+# Glossary entries scoring at least this relevance (0-1) are returned as-is, without an LLM call
+CONCEPT_DIRECT_HIT_THRESHOLD = float(os.getenv("CONCEPT_DIRECT_HIT_THRESHOLD", 0.85))
+
+# Glossary answers depend only on the concept, so they are shared across handlers and kept for a day by default
+concept_cache = LRUCache(
+    maxsize=int(os.getenv("CONCEPT_CACHE_SIZE", 2048)),
+    ttl=float(os.getenv("CONCEPT_CACHE_TTL", 24 * 60 * 60)),
+)
+
+
+def normalise_concept(concept: str) -> str:
+    """
+    Normalises a concept name into a cache key, e.g. "What is the P/E Ratio?" -> "p e ratio".
+    """
+    concept = concept.lower().strip()
+    concept = re.sub(r"^(what\s+is|what's|whats|explain|define|meaning\s+of)\s+", "", concept)
+    concept = re.sub(r"^(the|a|an)\s+", "", concept)
+    concept = re.sub(r"[^a-z0-9]+", " ", concept)
+    return concept.strip()
+
+
 # Concept Clarification RAG chain 
 def build_concept_clarifier(llm, vector_db):
     retriever = vector_db.as_retriever()
@@ -42,50 +70,136 @@ def build_concept_clarifier(llm, vector_db):
 
 
 
+# Search agent execution limits per clarification action
+AGENT_POLICIES = {
+    "clarify_concept": AgentPolicy(max_steps=4, max_seconds=20),
+    "clarify_company": AgentPolicy(max_steps=6, max_seconds=30),
+    "clarify_comparison": AgentPolicy(max_steps=8, max_seconds=45, fallback="generate"),
+}
+
+# Comparisons fan out over several companies, so their tool calls are planned and run concurrently
+AGENT_MODES = {
+    "clarify_comparison": "plan",
+}
+
+
 # Main handler
 class ClarificationHandler:
-    def __init__(self, verbose = False):
-        self.llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0)
+    def __init__(self, verbose = False, agent_policies: dict = None):
+        self.llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0, rate_limiter=chat_rate_limiter())
         self.vector_db = load_vector_db()
-        self.concept_chain = build_concept_clarifier(self.llm, self.vector_db)
-        self.search_agent = build_search_agent(self.llm, verbose=verbose)
+        # The concept answer goes straight to the user, so it is streamed on streamed requests;
+        # a bare "No" means the glossary has no answer and the search agent takes over
+        self.answer_llm = ChatModel(model="gemini-2.0-flash", temperature=0, stream_to_sink=True, withhold=("no",), rate_limiter=chat_rate_limiter())
+        self.concept_chain = build_concept_clarifier(self.answer_llm, self.vector_db)
+
+        policies = {**AGENT_POLICIES, **(agent_policies or {})}
+        self.search_agents = {
+            action: build_search_agent(self.llm, verbose=verbose, policy=policy, mode=AGENT_MODES.get(action))
+            for action, policy in policies.items()
+        }
+
+    def run_search_agent(self, action: str, query: str) -> str:
+        """
+        Runs the search agent configured for the given clarification action.
+        """
+        return run_search_agent(self.search_agents[action], query)
+
+    def known_concept_answer(self, action_json: dict = None) -> str:
+        """
+        Fast paths, without an LLM call: a previously answered concept, or a confident glossary match.
+        Returns an empty string if neither applies.
+        """
+        concept = self.get_concept_from_json(action_json)
+        cache_key = normalise_concept(concept) if concept else ""
+        if not cache_key:
+            return ""
+        cached = concept_cache.get(cache_key)
+        if cached:
+            return cached
+        response = self.lookup_glossary(concept)
+        if response:
+            concept_cache.set(cache_key, response)
+        return response
+
+    def handle_clarify_concept(self, history: list, user_query: str, action_json: dict = None, refined_query: str = None, fast_path: bool = True):
 
-    def handle_clarify_concept(self, history: list, user_query: str, action_json: dict = None):
+        # Callers that already tried known_concept_answer() pass fast_path=False
+        if fast_path:
+            response = self.known_concept_answer(action_json)
+            if response:
+                return response
 
-        user_query = contextualize_user_query(self.llm, history, user_query)
+        user_query = refined_query or self.contextualize(history, user_query)
         
         if action_json and "parameters" in action_json and "concept" in action_json["parameters"]:
             response = self.concept_chain.run(define_user_query(user_query))
         else:
             response = self.concept_chain.run(define_user_query(user_query))
 
-        if not response or response.lower() == "no":
-            return self.search_agent.run(f"Explain the financial concept: {user_query}")
+        if not response or response.strip().lower() == "no":
+            response = self.run_search_agent("clarify_concept", f"Explain the financial concept: {user_query}")
+
+        # Not put in concept_cache: the answer comes from the contextualised query (e.g. "P/E for Apple here"),
+        # not from the concept alone. The semantic cache keeps it, partitioned by concept (see QueryParser)
         return response
 
-    def handle_clarify_company(self, history: list, user_query: str, action_json: dict = None):
+    def contextualize(self, history: list, user_query: str) -> str:
+        """
+        Rewrites the user query into a standalone search query using the conversation history.
+        Does not depend on the action, so it can run before the intent is known (see services.speculation).
+        """
+        return contextualize_user_query(self.llm, history, user_query)
+
+    def lookup_glossary(self, concept: str) -> str:
+        """
+        Returns the glossary entry for the concept if its relevance score clears
+        CONCEPT_DIRECT_HIT_THRESHOLD, otherwise an empty string.
+        """
+        try:
+            matches = self.vector_db.similarity_search_with_relevance_scores(concept, k=1)
+        except Exception as e:
+            print(f"Glossary lookup failed: {e}")
+            return ""
+        if matches:
+            doc, score = matches[0]
+            if score >= CONCEPT_DIRECT_HIT_THRESHOLD:
+                return doc.page_content
+        return ""
+
+    def handle_clarify_company(self, history: list, user_query: str, action_json: dict = None, refined_query: str = None):
 
-        user_query = contextualize_user_query(self.llm, history, user_query)
+        user_query = refined_query or self.contextualize(history, user_query)
 
         companies = self.get_company_from_json(action_json)
         if companies:
-            return self.search_agent.run(f"Clarify about the {companies}: {user_query}")
+            return self.run_search_agent("clarify_company", f"Clarify about the {companies}: {user_query}")
         
         # If no specific company is provided, use the last message to infer the company
-        return self.search_agent.run(f"Clarify : {user_query}")
+        return self.run_search_agent("clarify_company", f"Clarify : {user_query}")
 
-    def handle_clarify_comparison(self, history: list, user_query: str, action_json: dict = None):
+    def handle_clarify_comparison(self, history: list, user_query: str, action_json: dict = None, refined_query: str = None):
 
-        user_query = contextualize_user_query(self.llm, history, user_query)
+        user_query = refined_query or self.contextualize(history, user_query)
 
         companies = self.get_company_from_json(action_json)
         if companies: 
-            return self.search_agent.run(f"Compare the {companies} on the basis of: {user_query}")
+            return self.run_search_agent("clarify_comparison", f"Compare the {companies} on the basis of: {user_query}")
                 
         # If no specific company is provided, use the last message to infer the company
-        return self.search_agent.run(f"Compare companies: {user_query}")
+        return self.run_search_agent("clarify_comparison", f"Compare companies: {user_query}")
 
 
+    def get_concept_from_json(self, action_json: dict) -> str:
+
+        """
+        Extracts the concept name from the action JSON if available.
+        """
+
+        if action_json and "parameters" in action_json:
+            return action_json["parameters"].get("concept") or ""
+        return ""
+
     def get_company_from_json(self, action_json: dict) -> str:
 
         """
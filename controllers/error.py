@@ -27,7 +27,7 @@ class ErrorController(LLM):
         Handles the error action by denying user request and providing information about the platform's capabilities.
         Returns a response text.
         """
-        response = self.send_message_with_history(history, message)
+        response = self.send_message_with_history(history, message, stream=True)
         if not response:
             response = "Sorry, I couldn't provide help at the moment."  # Fallback response
         
@@ -2,15 +2,28 @@ from typing import List, Dict, Any
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
-from langchain_community.document_loaders import WebBaseLoader
-from langchain.chains.summarize import load_summarize_chain
+from langchain.chains.combine_documents.reduce import ReduceDocumentsChain
+from langchain.chains.combine_documents.stuff import StuffDocumentsChain
+from langchain_core.documents import Document
 from langchain_community.tools.tavily_search import TavilySearchResults
 from services.contextualize_user_query import format_history
+from services.metrics import span, registry, ARTICLE_SUMMARIES
 from utils.load_google_credentials import setup_google_credentials
+from services.callbacks import install_callbacks
+from services.chat_model import ChatModel
+from services.rate_limit import chat_rate_limiter, limiter
+from services.singleflight import group
+from services.download_content import iter_documents
+from services.dedup import deduplicate
+from services.news_digest import find_digest
+from services.article_summaries import article_key, get_article_store
 from dotenv import load_dotenv
 
 load_dotenv()
 setup_google_credentials()
+install_callbacks()
+
+NO_NEWS_OUTPUT = "No relevant news articles found."
 
 
 class NewsSummary:
@@ -24,8 +37,7 @@ class NewsSummary:
 
     def __init__(self, model_name="gemini-2.0-flash", verbose=False):
         self.verbose = verbose
-        self.llm = ChatGoogleGenerativeAI(model=model_name, temperature=0)
-        self.summarizer = load_summarize_chain(self.llm, chain_type="map_reduce")
+        self.llm = ChatGoogleGenerativeAI(model=model_name, temperature=0, rate_limiter=chat_rate_limiter())
         self.search_tool = TavilySearchResults(k=10)
 
         # Query-refinement chain
@@ -43,21 +55,20 @@ class NewsSummary:
         )
 
 
-        # Summarization...
-        map_prompt = PromptTemplate(
-            input_variables=["text", "query"],
+        # Summarization: every article is summarised once, independently of the query, and the
+        # summaries are persisted so later requests only reduce them for the user's message
+        article_prompt = PromptTemplate(
+            input_variables=["text"],
             template="""
                 You are a financial news assistant.
-                Here is a chunk of a news article:
+                Here is a news article:
                 ---------------------
                 {text}
                 ---------------------
 
-                Given the user query:
-                "{query}"
-
-                Write a short, relevant summary of this chunk that answers the query.
-                Ignore irrelevant details.
+                Write a short summary of the facts in this article that matter to an investor:
+                the companies involved, figures, events, guidance and market reaction.
+                Ignore navigation text, ads and other irrelevant details.
                 """
             )
 
@@ -65,7 +76,7 @@ class NewsSummary:
             input_variables=["text", "query"],
             template="""
                 You are a financial news assistant.
-                Below are summaries of news article chunks, written based on the query:
+                Below are summaries of news articles, relevant to the query:
                 "{query}"
 
                 ---------------------
@@ -78,12 +89,19 @@ class NewsSummary:
                 """
             )
 
-        # Build the summarizer chain
-        self.summarizer = load_summarize_chain(
-            llm=self.llm,
-            chain_type="map_reduce",
-            map_prompt=map_prompt,
-            combine_prompt=reduce_prompt,
+        self.article_chain = LLMChain(llm=self.llm, prompt=article_prompt, output_key="summary")
+        self.article_store = get_article_store()
+
+        # Reduce the article summaries into the answer. Only the final step is streamed on streamed
+        # requests; intermediate collapses (when the summaries do not fit one prompt) use the plain model
+        reduce_llm = ChatModel(model=model_name, temperature=0, stream_to_sink=True, rate_limiter=chat_rate_limiter())
+        self.reducer = ReduceDocumentsChain(
+            combine_documents_chain=StuffDocumentsChain(
+                llm_chain=LLMChain(llm=reduce_llm, prompt=reduce_prompt), document_variable_name="text"
+            ),
+            collapse_documents_chain=StuffDocumentsChain(
+                llm_chain=LLMChain(llm=self.llm, prompt=reduce_prompt), document_variable_name="text"
+            ),
         )
 
 
@@ -92,7 +110,7 @@ class NewsSummary:
         history = format_history(history)
 
         q = self.query_chain.invoke({
-            "history": "\n".join(history),
+            "history": history,
             "latest_message": latest_message
         })["search_query"].strip()
         print(q)
@@ -101,7 +119,8 @@ class NewsSummary:
         return q
 
     def search_with_agent(self, query: str) -> List[str]:
-        result = self.search_tool.run(query)
+        with span("search", provider="tavily"):
+            result = group("tavily").do(query, limiter("tavily").run_tool, self.search_tool, query)
         if self.verbose:
             print("[NEWS] Search result:", result)
 
@@ -113,31 +132,102 @@ class NewsSummary:
 
 
     def load_documents(self, urls: List[str]) -> List[Any]:
-        if not urls:
-            return []
-        docs = WebBaseLoader(urls).load()
+        # Each page is capped in size (see services.download_content), so the list stays bounded
+        loaded = list(iter_documents(urls))
+        # Syndicated copies of one story are summarised once
+        docs = deduplicate(loaded)
         if self.verbose:
-            print(f"[NEWS] Loaded {len(docs)} documents")
+            print(f"[NEWS] Loaded {len(loaded)} documents, {len(docs)} after removing near-duplicates")
 
         return docs
 
-    def handle_news_summary(self, history: List[str], latest_message: str, verbose=None, *args) -> Dict[str, Any]:
+    def digest_answer(self, action_json: dict = None) -> str:
+        """
+        Watchlisted companies are answered from the digest the background refresher keeps up to date.
+        Returns an empty string for other companies.
+        """
+        digest = find_digest(self.get_company_from_json(action_json))
+        if not digest:
+            return ""
+        if self.verbose:
+            print(f"[NEWS] Answered from the {digest['ticker']} digest")
+        return digest["summary"]
+
+    def handle_news_summary(self, history: List[str], latest_message: str, action_json: dict = None, refined_query: str = None, verbose=None, fast_path: bool = True) -> Dict[str, Any]:
         if verbose is not None:
             self.verbose = verbose
 
-        query = self.generate_query(history, latest_message)
-        urls = self.search_with_agent(query)
-        docs = self.load_documents(urls)
-        if docs:
-            summary = self.summarizer.run({"input_documents": docs, "query": latest_message}) 
-        else:
-            summary = "No relevant news articles found."
-        
+        # Callers that already tried digest_answer() pass fast_path=False
+        if fast_path:
+            digest = self.digest_answer(action_json)
+            if digest:
+                return digest
+
+        query = refined_query
+        if not query:
+            with span("query_refine", handler="news"):
+                query = self.generate_query(history, latest_message)
+
+        # Users asking about the same news at the same time share one search, download and summary.
+        # Only the first of them gets the summary streamed; the others receive it whole
+        summary = group("news_summary").do((query, latest_message.strip().lower()), self.summarise_news, query, latest_message)
+
         if self.verbose:
             print("[NEWS] Summary:", summary)
 
         return summary
 
+    def summarise_news(self, query: str, latest_message: str) -> str:
+        """
+        Searches the news for the refined query and summarises the articles for the user's message.
+        """
+        urls = self.search_with_agent(query)
+        docs = self.load_documents(urls)
+        with span("summarize", handler="news"):
+            summaries = [summary for summary in self.summarise_articles(docs) if summary]
+            if summaries:
+                return self.merge_summaries(summaries, latest_message)
+        return NO_NEWS_OUTPUT
+
+    def summarise_articles(self, docs: List[Any]) -> List[str]:
+        """
+        Summarises each article, reusing the stored summary of any article seen before with the same
+        content; only new or changed articles go to the model. Empty articles get an empty summary.
+        """
+        keys = [article_key(doc.metadata.get("source", ""), doc.page_content) for doc in docs]
+        stored = self.article_store.get_many(list(set(keys)))
+        missing = {}
+        for key, doc in zip(keys, docs):
+            if key not in stored and key not in missing and doc.page_content.strip():
+                missing[key] = doc
+
+        if missing:
+            results = self.article_chain.batch([{"text": doc.page_content} for doc in missing.values()], return_exceptions=True)
+            fresh = {}
+            for (key, doc), result in zip(missing.items(), results):
+                if isinstance(result, Exception):
+                    print(f"[NEWS] Could not summarise {doc.metadata.get('source')}: {result}")
+                    continue
+                fresh[key] = result["summary"].strip()
+            self.article_store.put_many(fresh)
+            stored.update(fresh)
+
+        registry.inc(ARTICLE_SUMMARIES, len(docs) - len(missing), outcome="hit")
+        registry.inc(ARTICLE_SUMMARIES, len(missing), outcome="miss")
+        if self.verbose:
+            print(f"[NEWS] Article summaries: {len(docs) - len(missing)} reused, {len(missing)} new")
+        return [stored.get(key, "") for key in keys]
+
+    def merge_summaries(self, summaries: List[str], query: str) -> str:
+        docs = [Document(page_content=summary) for summary in summaries]
+        return self.reducer.run({"input_documents": docs, "query": query}).strip()
+
+    def get_company_from_json(self, action_json: dict) -> str:
+        if action_json and "parameters" in action_json:
+            parameters = action_json["parameters"]
+            return parameters.get("company") or parameters.get("ticker") or ""
+        return ""
+
 
 if __name__ == "__main__":
     summariser = NewsSummary(verbose=True)
@@ -147,5 +237,5 @@ if __name__ == "__main__":
         if u.lower() in ("exit", "quit"):
             break
         history.append(f"User: {u}")
-        resp = summariser.handle_news(history, u)
+        resp = summariser.handle_news_summary(history, u)
         print("Model:", resp)
@@ -2,12 +2,12 @@ import re
 import json
 from services.llm import LLM
 from services.llm_system_messages import QUERY_PARSE_INSTRUCTIONS
-from controllers.news_summariser import NewsSummary
-from controllers.clarification import ClarificationHandler
-from controllers.help import HelpController
-from controllers.error import ErrorController  
-from controllers.report_generator import ReportGenerator
 from services.data_parser import parse_json
+from services.schemas import STRUCTURED_OUTPUT, ActionRouting, to_dict
+from services.metrics import span
+from services.speculation import SPECULATIVE_MODE, Speculation, predict_action, taken
+from services.semantic_cache import get_semantic_cache
+from utils.lazy import Lazy
 
 class QueryParser:
     def __init__(self):
@@ -22,9 +22,31 @@ class QueryParser:
 
         query = chat_history[-1]['parts'][0]['text'] if chat_history else ""
         history = chat_history[:-1]  # Exclude the last user message from history
-        parsed_query = self.parse_query(history, query)
+        speculation = self.speculate(history, query)
+        try:
+            with span("intent_parse"):
+                parsed_query = self.parse_query(history, query)
 
-        return self.response.generate_response(history, query, parsed_query, query_summary)
+            action = parsed_query.get("action", "unknown") if parsed_query else "unknown"
+            with span("handler", action=action):
+                return self.response.generate_response(history, query, parsed_query, query_summary, speculation)
+        finally:
+            if speculation is not None:
+                speculation.discard()
+
+    def speculate(self, history, query):
+        """
+        Starts handler steps that can run while the intent is being parsed (see services.speculation).
+        Returns None when SPECULATIVE_MODE is off.
+        """
+        if SPECULATIVE_MODE not in ("refine", "predict"):
+            return None
+
+        speculation = Speculation()
+        speculation.start("contextualize", lambda: self.response.clarification_handler.contextualize(history, query))
+        if SPECULATIVE_MODE == "predict" and predict_action(query) == "news_summary":
+            speculation.start("news_query", lambda: self.response.news_summariser.generate_query(history, query))
+        return speculation
 
 
     def get_llm_response(self, history, message):
@@ -39,6 +61,9 @@ class QueryParser:
         Parses the query by sending it to the LLM and extracting the JSON response.
         Returns a dict with the parsed parameters or None if parsing fails.
         """
+        if STRUCTURED_OUTPUT:
+            return to_dict(self.llm.send_structured_message_with_history(history, message, ActionRouting))
+
         llm_response = self.get_llm_response(history, message)
         if not llm_response:
             return None
@@ -47,24 +72,161 @@ class QueryParser:
         return parsed_json if parsed_json else None
 
 
+# Handler builders import their controller only when called, so unused handlers
+# (and their langchain, FAISS and search dependencies) are never loaded
+def build_help_controller():
+    from controllers.help import HelpController
+    return HelpController()
+
+
+def build_error_controller():
+    from controllers.error import ErrorController
+    return ErrorController()
+
+
+def build_news_summariser():
+    from controllers.news_summariser import NewsSummary
+    return NewsSummary()
+
+
+def build_clarification_handler():
+    from controllers.clarification import ClarificationHandler
+    return ClarificationHandler(verbose=True)
+
+
+def build_report_generator():
+    from controllers.report_generator import ReportGenerator
+    return ReportGenerator(verbose=True)
+
+
 class GenerateResponseController:
 
     def __init__(self):
-        
-        self.help_controller = HelpController()
-        self.error_controller = ErrorController()
-    
-        self.news_summariser = NewsSummary()
-        self.handle_internal_error = self.help_controller.handle_help
+        # Each handler is built on first use, or ahead of time by warm_up()
+        self.handlers = {
+            "help": Lazy(build_help_controller),
+            "error": Lazy(build_error_controller),
+            "news": Lazy(build_news_summariser),
+            "clarification": Lazy(build_clarification_handler),
+            "report": Lazy(build_report_generator),
+        }
+
+    @property
+    def help_controller(self):
+        return self.handlers["help"].get()
+
+    @property
+    def error_controller(self):
+        return self.handlers["error"].get()
+
+    @property
+    def news_summariser(self):
+        return self.handlers["news"].get()
+
+    @property
+    def clarification_handler(self):
+        return self.handlers["clarification"].get()
+
+    @property
+    def report_generator(self):
+        return self.handlers["report"].get()
 
-        self.clarification_handler = ClarificationHandler(verbose=True)
-        self.report_generator = ReportGenerator(verbose=True)
+    def handle_internal_error(self, history, message, action_json):
+        return self.help_controller.handle_help(history, message, action_json)
 
-    def generate_response(self, history, message, action_json, query_summary=None):
+    def warm_up(self):
+        """
+        Builds every handler, cheapest first.
+        """
+        for handler in self.handlers.values():
+            handler.get()
+
+    def generate_response(self, history, message, action_json, query_summary=None, speculation=None):
         """
         Generates a response from the LLM based on the conversation history and the new message.
+        Steps already started speculatively for this message are taken from speculation.
+        Similar questions asked before are answered from the semantic cache (see services.semantic_cache).
         Returns the response text.
         """
+        action = action_json.get("action", "") if action_json is not None else None
+
+        # Answers that need no LLM call come first; nothing below is worth waiting for when they hit
+        response = self.known_answer(action, action_json)
+        if response:
+            return response
+
+        cache = get_semantic_cache()
+        if not cache.caches(action):
+            return self.route(history, message, action_json, query_summary, speculation)
+
+        refined_query = self.refine_for_cache(action, history, message, speculation)
+        lookup_query = refined_query or message
+
+        try:
+            cached = cache.get(action, action_json, lookup_query)
+        except Exception as e:
+            print(f"Semantic cache lookup failed: {e}")
+            cached = None
+        if cached:
+            return cached
+
+        response = self.route(history, message, action_json, query_summary, speculation, refined_query)
+        if self.is_answer(response):
+            try:
+                cache.put(action, action_json, lookup_query, response)
+            except Exception as e:
+                print(f"Semantic cache store failed: {e}")
+        return response
+
+    def refine_for_cache(self, action, history, message, speculation=None):
+        """
+        The standalone query the semantic cache is looked up by, so follow-ups like "and its P/E?" match
+        too. It is passed on to the handler, which would otherwise compute it itself. None means the
+        message itself.
+        """
+        if action == "news_summary":
+            # The search query the news handler refines the message into anyway
+            refined_query = taken(speculation, "news_query")
+            if refined_query is None:
+                with span("query_refine", handler="news"):
+                    refined_query = self.news_summariser.generate_query(history, message)
+            return refined_query
+        if action == "clarify_concept":
+            # Concept entries are partitioned by the concept itself
+            return None
+        refined_query = taken(speculation, "contextualize")
+        # A first message is already standalone
+        if refined_query is None and any(m.get("role") == "user" for m in history):
+            refined_query = self.clarification_handler.contextualize(history, message)
+        return refined_query
+
+    def known_answer(self, action, action_json) -> str:
+        """
+        Cached or glossary concept answers and watchlist news digests, or an empty string.
+        """
+        if action == "clarify_concept":
+            return self.clarification_handler.known_concept_answer(action_json)
+        if action == "news_summary":
+            return self.news_summariser.digest_answer(action_json)
+        return ""
+
+    def is_answer(self, response) -> bool:
+        """
+        False for empty responses, fallbacks from stopped search agents and the handlers' "nothing found"
+        messages, which are not worth caching.
+        """
+        from services.agents import NO_ANSWER_OUTPUT, PartialAnswer
+        from controllers.news_summariser import NO_NEWS_OUTPUT
+        if not isinstance(response, str) or isinstance(response, PartialAnswer) or not response.strip():
+            return False
+        return response not in (NO_ANSWER_OUTPUT, NO_NEWS_OUTPUT)
+
+    def route(self, history, message, action_json, query_summary=None, speculation=None, refined_query=None):
+        """
+        Runs the handler for the parsed action and returns its response. Fast paths have been tried
+        by generate_response. A speculative result is waited for only in the branches that use it;
+        the others leave it to be discarded.
+        """
 
         # Check for all the actions and generate response accordingly..
         if action_json is not None:
@@ -78,19 +240,27 @@ class GenerateResponseController:
             return self.report_generator.handle_report(history, message, action_json, query_summary)
         elif action == "clarify_concept":
             # Handle clarify action
-            return self.clarification_handler.handle_clarify_concept(history, message, action_json)
+            return self.clarification_handler.handle_clarify_concept(
+                history, message, action_json, refined_query=refined_query or taken(speculation, "contextualize"), fast_path=False
+            )
         elif action == "clarify_company":
             # Handle company clarify action
-            return self.clarification_handler.handle_clarify_company(history, message, action_json)
+            return self.clarification_handler.handle_clarify_company(
+                history, message, action_json, refined_query=refined_query or taken(speculation, "contextualize")
+            )
         elif action == "clarify_comparison":
             # Handle clarify comparison action
-            return self.clarification_handler.handle_clarify_comparison(history, message, action_json)
+            return self.clarification_handler.handle_clarify_comparison(
+                history, message, action_json, refined_query=refined_query or taken(speculation, "contextualize")
+            )
         elif action == "recommend":
             # Handle recommend action
             return self.handle_recommend(history, message, action_json)
         elif action == "news_summary":
             # Handle news summary action
-            return self.news_summariser.handle_news_summary(history, message, action_json)
+            return self.news_summariser.handle_news_summary(
+                history, message, action_json, refined_query=refined_query or taken(speculation, "news_query"), fast_path=False
+            )
         elif action == "help":
             # Handle help action
             return self.help_controller.handle_help(history, message, action_json)
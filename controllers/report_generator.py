@@ -1,22 +1,97 @@
 import os
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain, SequentialChain
 from dotenv import load_dotenv
 from services.contextualize_user_query import format_history
 from services.data_parser import parse_json, parse_list
+from services.schemas import STRUCTURED_OUTPUT, ReportIntent, SearchQueries, parse_structured, to_dict
 from controllers.clarification import ClarificationHandler
 from langchain_community.tools.tavily_search import TavilySearchResults
 from utils.load_google_credentials import setup_google_credentials
-from services.download_content import load_documents
+from services.callbacks import install_callbacks
+from services.download_content import download_and_extract_text
+from services.dedup import canonical_keys
+from services.metrics import span
+from services.rate_limit import chat_rate_limiter, limiter
+from services.singleflight import group
 
 
 load_dotenv()
 setup_google_credentials()
+install_callbacks()
+
+# Report sections and what each one covers
+REPORT_SECTIONS = [
+    ("summary", "A concise summary of the company's current position and outlook."),
+    ("keyMetrics", "Key financial metrics such as market cap, P/E ratio, revenue, gross margin, etc."),
+    ("businessOverview", "Overview of the company's business, segments, and geographic breakdown."),
+    ("financialPerformance", "Recent financial performance, growth, margins, and cash flow."),
+    ("valuation", "Current valuation, price targets, and valuation summary."),
+    ("riskFactors", "Major risk factors affecting the company."),
+    ("boardInfo", "Board composition and governance highlights."),
+    ("competitiveLandscape", "Key competitors, advantages, and competitive summary."),
+    ("strategicOutlook", "Growth catalysts, recommendation, and strategic summary."),
+]
+
+# Bulk reports run their searches, downloads and section synthesis on one pool shared by all bulk requests
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", 8))
+# Search context per company: documents are cut to REPORT_DOCUMENT_CHARS, the whole context to REPORT_CONTEXT_CHARS
+REPORT_CONTEXT_CHARS = int(os.getenv("REPORT_CONTEXT_CHARS", 20000))
+REPORT_DOCUMENT_CHARS = int(os.getenv("REPORT_DOCUMENT_CHARS", 4000))
+
+_executor = None
+
+
+def get_report_executor():
+    global _executor
+    if _executor is None:
+        # Created on first use, so gunicorn workers start their own threads after the fork
+        _executor = ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix="report")
+    return _executor
+
+
+def query_key(item) -> str:
+    """
+    Case- and whitespace-insensitive key: "TCS  Risk factors" and "tcs risk factors" are the same query.
+    """
+    return " ".join(str(item or "").lower().split())
+
+
+def unique(items) -> list:
+    """
+    Drops empty items and repeats (by query_key), keeping the first spelling.
+    """
+    seen = set()
+    result = []
+    for item in items:
+        key = query_key(item)
+        if key and key not in seen:
+            seen.add(key)
+            result.append(item)
+    return result
+
+
+def results_or_default(futures, default, what: str) -> list:
+    """
+    Results of [(label, future)] in order; a failed one is logged and replaced by default(label),
+    so one failed call does not fail a whole bulk request.
+    """
+    results = []
+    for label, future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            print(f"Bulk report: {what} failed for {label}: {e}")
+            results.append(default(label))
+    return results
+
 
 class ReportGenerator:
     def __init__(self, verbose=False):
-        self.llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0)
+        self.llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0, rate_limiter=chat_rate_limiter())
         self.verbose = verbose
         self.clarfication_handler = ClarificationHandler(verbose=verbose)
         self.search_tool = TavilySearchResults(k=10)
@@ -27,13 +102,7 @@ class ReportGenerator:
 
     def handle_report(self, history, user_query, action_json=None, query_summary=None):
 
-        formatted_history = format_history(history)
-        result = self.intent_and_factors_chain({
-            "history": formatted_history,
-            "user_query": user_query
-        })
-
-        parsed = parse_json(result.get("intent_and_factors", ""))
+        parsed = self.extract_intent_and_factors(history, user_query) or {}
         summary = {}
 
         print(parsed)
@@ -49,6 +118,36 @@ class ReportGenerator:
         self.update_query_summary(query_summary, summary)
         return rep
 
+    def extract_intent_and_factors(self, history, user_query):
+        """
+        Runs the intent and factors chain and returns its result as a dict, or None if it could not be parsed.
+        """
+        formatted_history = format_history(history)
+        result = self.intent_and_factors_chain.invoke({
+            "history": formatted_history,
+            "user_query": user_query
+        })
+
+        if STRUCTURED_OUTPUT:
+            return to_dict(parse_structured(ReportIntent, result["parsed"], result["raw"].content))
+        return parse_json(result.get("intent_and_factors", ""))
+
+    def generate_search_queries(self, user_preferences):
+        """
+        Returns the list of web search queries for the user's preferences.
+        """
+        chain = self.build_search_query_generation_chain()
+        if STRUCTURED_OUTPUT:
+            result = chain.invoke({"user_preferences": user_preferences})
+            queries = parse_structured(SearchQueries, result["parsed"], result["raw"].content)
+            if queries is not None:
+                return queries.queries
+            return parse_list(result["raw"].content) or []
+
+        return parse_list(chain.run({
+            "user_preferences": user_preferences
+        })) or []
+
     def update_query_summary(self, query_summary, summary):
         """
         Updates the query summary with the report details.
@@ -60,37 +159,44 @@ class ReportGenerator:
 
     
     def build_intent_and_factors_chain(self):
+        # The response schema has only the ReportFactors fields, so other factors are asked for
+        # only when the model answers in free-form JSON
+        other_factors = "" if STRUCTURED_OUTPUT else "    // ...other extracted fields\n"
+        prompt = PromptTemplate(
+            input_variables=["history", "user_query"],
+            template=(
+                "You are a financial assistant. "
+                "To determine the user's intent, ONLY use the latest user message (user_query):\n"
+                "- If the user_query is explicitly asking to generate a report (using words like 'generate report', 'create report', 'download report', etc.), and provides any parameters (like company, timeframe, focus areas, etc.), set \"intent\": true.\n"
+                "- In all other cases, including if the user is just asking a question, clarification, or not insisting on report generation, set \"intent\": false (this is the default).\n"
+                "Do NOT use the conversation history to decide intent, only use it to extract parameters if intent is true.\n\n"
+                "Conversation History (for extracting parameters only):\n{history}\n\n"
+                "User Query (for intent):\n{user_query}\n\n"
+                "Extract all key factors mentioned (company, focusAreas, timeframe, analysisType"
+                + ("" if STRUCTURED_OUTPUT else ", etc.") + ") as a JSON object. "
+                "Do NOT guess or invent any values. Only include what is explicitly mentioned in the query or history.\n\n"
+                "If intent is true, add a 'question' field to the JSON, asking the user for the most relevant missing parameter to proceed with report generation.\n\n"
+                "Output format:\n"
+                "{{\n"
+                "  \"intent\": true/false,\n"
+                "  \"factors\": {{\n"
+                "    \"company\": ...,\n  // Captialized company name, e.g. 'Apple Inc.'\n" 
+                "    \"focusAreas\": [...],\n"
+                "    \"timeframe\": ...,\n"
+                "    \"analysisType\": ...\n"
+                + other_factors +
+                "  }},\n"
+                "  \"question\": \"...\"  // Only present if intent is true\n"
+                "}}\n"
+                "If a field is missing, omit it from the JSON."
+            )
+        )
 
+        if STRUCTURED_OUTPUT:
+            return prompt | self.llm.with_structured_output(ReportIntent, method="json_mode", include_raw=True)
         return LLMChain(
             llm=self.llm,
-            prompt=PromptTemplate(
-                input_variables=["history", "user_query"],
-                template=(
-                    "You are a financial assistant. "
-                    "To determine the user's intent, ONLY use the latest user message (user_query):\n"
-                    "- If the user_query is explicitly asking to generate a report (using words like 'generate report', 'create report', 'download report', etc.), and provides any parameters (like company, timeframe, focus areas, etc.), set \"intent\": true.\n"
-                    "- In all other cases, including if the user is just asking a question, clarification, or not insisting on report generation, set \"intent\": false (this is the default).\n"
-                    "Do NOT use the conversation history to decide intent, only use it to extract parameters if intent is true.\n\n"
-                    "Conversation History (for extracting parameters only):\n{history}\n\n"
-                    "User Query (for intent):\n{user_query}\n\n"
-                    "Extract all key factors mentioned (company, focusAreas, timeframe, analysisType, etc.) as a JSON object. "
-                    "Do NOT guess or invent any values. Only include what is explicitly mentioned in the query or history.\n\n"
-                    "If intent is true, add a 'question' field to the JSON, asking the user for the most relevant missing parameter to proceed with report generation.\n\n"
-                    "Output format:\n"
-                    "{{\n"
-                    "  \"intent\": true/false,\n"
-                    "  \"factors\": {{\n"
-                    "    \"company\": ...,\n  // Captialized company name, e.g. 'Apple Inc.'\n" 
-                    "    \"focusAreas\": [...],\n"
-                    "    \"timeframe\": ...,\n"
-                    "    \"analysisType\": ...\n"
-                    "    // ...other extracted fields\n"
-                    "  }},\n"
-                    "  \"question\": \"...\"  // Only present if intent is true\n"
-                    "}}\n"
-                    "If a field is missing, omit it from the JSON."
-                )
-            ),
+            prompt=prompt,
             output_key="intent_and_factors"
         )
     
@@ -135,23 +241,192 @@ class ReportGenerator:
             )
         )
 
+        if STRUCTURED_OUTPUT:
+            return prompt | self.llm.with_structured_output(SearchQueries, method="json_mode", include_raw=True)
         return LLMChain(
             llm=self.llm,
             prompt=prompt,
             output_key="search_queries"
         )
     
-    def search_queries(self, search_queries):
+    def build_sector_query_generation_chain(self):
+        """
+        Returns a chain that generates the searches shared by a group of companies (sector, peers).
+        """
+        prompt = PromptTemplate(
+            input_variables=["companies"],
+            template=(
+                "You are a financial research analyst preparing reports on these companies together:\n"
+                "{companies}\n\n"
+                "Generate 3 to 6 web search queries for the research they share, so it is done once for all of them:\n"
+                "- Sector and industry trends and outlook\n"
+                "- Industry-wide risks and regulation\n"
+                "- How these companies compare with each other and with their other main competitors\n"
+                "Do NOT generate queries about a single company. Do NOT make up or guess any values.\n\n"
+                "Return ONLY a valid Python list of search queries, e.g.:\n"
+                "['IT services sector outlook 2025', 'Infosys vs TCS vs Wipro revenue growth comparison', ...]\n"
+            )
+        )
 
-        results_url = []
-        for query in search_queries:
-            result = self.search_tool.run(query)
-            for item in result:
-                if isinstance(item, dict) and "url" in item:
-                    results_url.append(item.get("url", ""))
-            
-        return results_url
+        if STRUCTURED_OUTPUT:
+            return prompt | self.llm.with_structured_output(SearchQueries, method="json_mode", include_raw=True)
+        return LLMChain(
+            llm=self.llm,
+            prompt=prompt,
+            output_key="search_queries"
+        )
 
+    def generate_sector_queries(self, query_summaries):
+        """
+        Returns the web search queries shared by all the companies of a bulk report.
+        """
+        companies = "\n".join(f"- {summary.get('company')}" for summary in query_summaries if summary.get("company"))
+        chain = self.build_sector_query_generation_chain()
+        if STRUCTURED_OUTPUT:
+            result = chain.invoke({"companies": companies})
+            queries = parse_structured(SearchQueries, result["parsed"], result["raw"].content)
+            if queries is not None:
+                return queries.queries
+            return parse_list(result["raw"].content) or []
+
+        return parse_list(chain.run({"companies": companies})) or []
+
+    def build_section_chain(self):
+        """
+        Returns an LLMChain that writes one report section from the search context and the report parameters.
+        """
+        return LLMChain(
+            llm=self.llm,
+            prompt=PromptTemplate(
+                input_variables=["section_name", "section_desc", "company", "focusAreas", "timeframe", "analysisType", "search_context"],
+                template=(
+                    "You are a financial analyst. Using ONLY the provided search context and parameters, generate the '{section_name}' section for a financial report.\n"
+                    "Section Description: {section_desc}\n"
+                    "Parameters:\n"
+                    "- Company: {company}\n"
+                    "- Focus Areas: {focusAreas}\n"
+                    "- Timeframe: {timeframe}\n"
+                    "- Analysis Type: {analysisType}\n"
+                    "Relevant Information:\n{search_context}\n\n"
+                    "If you do not have enough information for this section, simply output 'N/A'.\n"
+                    "Return ONLY the content for the '{section_name}' section."
+                )
+            ),
+            output_key="section"
+        )
+
+    def synthesise_section(self, query_summary, section_name, section_desc, search_context):
+        result = self.build_section_chain().run({
+            "section_name": section_name,
+            "section_desc": section_desc,
+            "company": query_summary.get("company", "N/A"),
+            "focusAreas": query_summary.get("focusAreas", "N/A"),
+            "timeframe": query_summary.get("timeframe", "N/A"),
+            "analysisType": query_summary.get("analysisType", "N/A"),
+            "search_context": search_context,
+        })
+        return result.strip() or "N/A"
+
+    def describe_preferences(self, query_summary):
+        return self.build_user_preferences_chain().run({"query_summary": query_summary})
+
+    def search_query(self, query):
+        """
+        Returns the result URLs for one web search.
+        """
+        with span("search", provider="tavily"):
+            result = group("tavily").do(query, limiter("tavily").run_tool, self.search_tool, query)
+        return [item["url"] for item in result if isinstance(item, dict) and item.get("url")]
+
+    def fetch_document(self, url):
+        """
+        Returns the part of the page text a report context can use, or an empty string if it could not be downloaded.
+        """
+        return download_and_extract_text(url)[:REPORT_DOCUMENT_CHARS]
+
+    def build_search_context(self, urls, documents):
+        """
+        Joins the documents of the given URLs into one context, within REPORT_CONTEXT_CHARS.
+        """
+        parts = []
+        size = 0
+        for url in urls:
+            text = documents.get(url, "")
+            if not text:
+                continue
+            if size + len(text) > REPORT_CONTEXT_CHARS:
+                break
+            parts.append(f"Source: {url}\n{text}")
+            size += len(text)
+        return "\n\n".join(parts) or "N/A"
+
+    def generate_reports(self, query_summaries):
+        """
+        Bulk mode: one report per query summary (e.g. every company of a sector), with the research shared:
+        1. user preferences and search queries per company, plus one set of sector-wide queries for all of them
+        2. every distinct query is searched once and every distinct URL downloaded once, whichever companies need it
+        3. the synthesis of every section of every report is scheduled on the shared report pool
+        Returns the reports in the order of the summaries.
+        """
+        summaries = [summary or {} for summary in query_summaries]
+        if not summaries:
+            return []
+        executor = get_report_executor()
+
+        # 1. Plan
+        sector_future = executor.submit(self.generate_sector_queries, summaries) if len(summaries) > 1 else None
+        companies = [summary.get("company", "N/A") for summary in summaries]
+        preferences = results_or_default(
+            [(company, executor.submit(self.describe_preferences, summary)) for company, summary in zip(companies, summaries)],
+            lambda _: None, "preferences",
+        )
+        # A company whose preferences cannot be described is researched from its raw summary
+        preferences = [text if text is not None else str(summary) for text, summary in zip(preferences, summaries)]
+        company_queries = [unique(queries) for queries in results_or_default(
+            [(companies[i], executor.submit(self.generate_search_queries, text)) for i, text in enumerate(preferences)],
+            lambda _: [], "search queries",
+        )]
+        sector_queries = unique(results_or_default([("sector", sector_future)], lambda _: [], "search queries")[0]) if sector_future else []
+        queries = unique([query for queries in company_queries for query in queries] + sector_queries)
+        print(f"Bulk report: {len(summaries)} companies, {len(queries)} distinct searches "
+              f"({sum(len(q) for q in company_queries) + len(sector_queries)} planned)")
+
+        # 2. Research
+        # Keyed by query_key, so each company's own spelling of a shared query finds its URLs
+        urls_by_query = dict(zip(map(query_key, queries), results_or_default(
+            [(query, executor.submit(self.search_query, query)) for query in queries], lambda _: [], "search",
+        )))
+        # URLs are deduplicated exactly; unique() folds case and is meant for queries
+        urls = list(dict.fromkeys(url for query_urls in urls_by_query.values() for url in query_urls if url))
+        with span("download", loader="report"):
+            documents = dict(zip(urls, executor.map(self.fetch_document, urls)))
+        # Syndicated copies of one story stand for their longest copy, so a context holds it once
+        canonical = canonical_keys(documents)
+        print(f"Bulk report: {len(urls)} distinct documents, {len(set(canonical.values()))} after removing near-duplicates")
+
+        def urls_for(query_list):
+            return [canonical.get(url, url) for query in query_list for url in urls_by_query.get(query_key(query), [])]
+
+        sector_urls = urls_for(sector_queries)
+        contexts = [self.build_search_context(list(dict.fromkeys(urls_for(queries) + sector_urls)), documents) for queries in company_queries]
+
+        # 3. Synthesis
+        sections = {
+            (i, name): executor.submit(self.synthesise_section, summary, name, desc, contexts[i])
+            for i, summary in enumerate(summaries)
+            for name, desc in REPORT_SECTIONS
+        }
+        reports = []
+        for i, summary in enumerate(summaries):
+            report = {"company": summary.get("company", "N/A"), "generatedAt": str(date.today())}
+            for name, _ in REPORT_SECTIONS:
+                try:
+                    report[name] = sections[(i, name)].result()
+                except Exception as e:
+                    print(f"Report section {name} failed for {report['company']}: {e}")
+                    report[name] = "N/A"
+            reports.append(report)
+        return reports
 
     # def build_report_chain(self):
     #     """
@@ -258,62 +533,7 @@ class ReportGenerator:
 
     def generate_report(self, query_summary):
         """
-        Generates the full report JSON using the report chain.
+        Generates the full report JSON for one query summary: the bulk pipeline (generate_reports)
+        with a single company, so its downloaded pages go into the section context instead of being dropped.
         """
-
-
-        # Extract parameters
-
-        user_preferences = self.build_user_preferences_chain().run({
-            "query_summary": query_summary
-        })
-
-        print("User Preferences: ", user_preferences)
-
-        queries = parse_list(self.build_search_query_generation_chain().run({
-            "user_preferences": user_preferences
-        }))
-        print("Generated Search Queries: ", queries)
-
-        # Search for relevant information using the generated queries
-        urls = self.search_queries(queries)
-        docs = load_documents(urls)
-
-        print("Loaded Documents: ", len(docs)) 
-
-        
-           
-
-
-        
-        # # Optionally, aggregate search context for all sections (or do per-section in build_report_chain)
-        # search_context = self.clarfication_handler.search_agent.run(
-        #     f"{company} {focusAreas} {timeframe} {analysisType} financial report"
-        # )
-
-        # # Run the report chain
-        # report_chain = self.build_report_chain()
-        # sections = report_chain({
-        #     "company": company,
-        #     "focusAreas": focusAreas,
-        #     "timeframe": timeframe,
-        #     "analysisType": analysisType,
-        #     "search_context": search_context
-        # })
-
-        # # Compose the final report JSON
-        # from datetime import date
-        # report = {
-        #     "company": company,
-        #     "generatedAt": str(date.today()),
-        #     "summary": sections.get("summary", "N/A"),
-        #     "keyMetrics": sections.get("keyMetrics", "N/A"),
-        #     "businessOverview": sections.get("businessOverview", "N/A"),
-        #     "financialPerformance": sections.get("financialPerformance", "N/A"),
-        #     "valuation": sections.get("valuation", "N/A"),
-        #     "riskFactors": sections.get("riskFactors", "N/A"),
-        #     "boardInfo": sections.get("boardInfo", "N/A"),
-        #     "competitiveLandscape": sections.get("competitiveLandscape", "N/A"),
-        #     "strategicOutlook": sections.get("strategicOutlook", "N/A"),
-        # }
-        # return report
+        return self.generate_reports([query_summary])[0]
@@ -0,0 +1,48 @@
+"""
+gunicorn configuration: gunicorn -c gunicorn.conf.py
+
+The master imports the app and loads read-only assets (controller modules, prompt
+templates, glossary index) once before forking, so workers share those pages
+copy-on-write instead of each loading their own copy. Each worker then creates its
+own network clients and builds its controllers in a background warm-up thread.
+"""
+import gc
+import os
+import multiprocessing
+
+wsgi_app = "app:app"
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", min(multiprocessing.cpu_count() * 2 + 1, 8)))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+# LLM calls and report generation can take well over gunicorn's 30 second default
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 180))
+graceful_timeout = 30
+keepalive = 5
+preload_app = True
+
+# Workers warm up themselves after fork; a thread started in the master would not survive it
+raw_env = ["WARMUP=0"]
+
+# Garbage collection in the master would touch every object header and dirty the shared pages;
+# it stays off until the assets are frozen and is re-enabled in each worker
+gc.disable()
+
+
+def when_ready(server):
+    from app import preload_shared_assets
+    preload_shared_assets()
+    # Move everything loaded so far out of the collector's reach, so workers never write to those pages
+    gc.freeze()
+    server.log.info("Shared assets preloaded and frozen")
+
+
+def post_fork(server, worker):
+    gc.enable()
+    from app import reinit_after_fork
+    reinit_after_fork()
+
+
+def post_worker_init(worker):
+    from app import start_warm_up
+    start_warm_up()
@@ -0,0 +1,44 @@
+import os
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from routes.query import query_parser
+
+batch_bp = Blueprint("batch", __name__)
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 10000))
+
+
+@batch_bp.route("/api/batch", methods=["POST"])
+def batch():
+    """
+    Runs many queries (see services.batch): a JSONL body, or JSON {"items": [...]}, with
+    optional ?concurrency=N. Streams one NDJSON "result" event per query as it completes,
+    then a "final" event with the counts. To resume, resend only the ids that have no result.
+    """
+    from services.batch import BATCH_CONCURRENCY, parse_item, read_items, run_batch
+    from services.streaming import format_ndjson
+
+    if request.is_json:
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict) or not isinstance(body.get("items") or [], list):
+            return jsonify({"error": 'Expected a JSON object {"items": [...]}'}), 400
+        items = [parse_item(data, i) for i, data in enumerate(body.get("items") or [], start=1)]
+    else:
+        items = list(read_items(request.get_data(as_text=True).splitlines()))
+    if not items:
+        return jsonify({"error": "No queries given"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {BATCH_MAX_ITEMS} queries per batch"}), 413
+    concurrency = max(1, min(request.args.get("concurrency", BATCH_CONCURRENCY, type=int), BATCH_CONCURRENCY))
+
+    handle = query_parser.get().handle_query
+
+    def events():
+        counts = {"total": 0, "duplicates": 0, "errors": 0}
+        for result in run_batch(items, handle, concurrency):
+            counts["total"] += 1
+            counts["errors"] += result["error"] is not None
+            counts["duplicates"] += result["duplicate_of"] is not None
+            yield format_ndjson("result", result)
+        yield format_ndjson("final", counts)
+
+    return Response(stream_with_context(events()), mimetype="application/x-ndjson", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,7 +1,77 @@
-from flask import Blueprint, send_from_directory
+import os
+from flask import Blueprint, request, jsonify, send_from_directory, url_for
+from services.report_store import REPORTS_DIR
 
 download_bp = Blueprint("download", __name__)
 
+# Export file names change with the report content, so clients may cache them for good
+EXPORT_MAX_AGE = 365 * 24 * 60 * 60
+
+
 @download_bp.route("/api/download/<filename>", methods=["GET"])
 def download(filename):
-    return send_from_directory("static/reports", filename)
+    # Conditional responses: ETag / If-None-Match and Range requests are answered by send_file
+    from services.report_export import EXPORT_FORMATS
+    exported = filename.rsplit(".", 1)[-1] in EXPORT_FORMATS
+    return send_from_directory(
+        os.path.abspath(REPORTS_DIR), filename, conditional=True, etag=True, max_age=EXPORT_MAX_AGE if exported else None
+    )
+
+
+def export_response(report_id, fmt, status):
+    from services.report_export import export_error, export_filename
+    body = {"id": report_id, "format": fmt, "status": status}
+    if status == "ready":
+        body["url"] = url_for("download.download", filename=export_filename(report_id, fmt))
+        return jsonify(body), 200
+    if status == "failed":
+        body["error"] = export_error(report_id, fmt)
+        return jsonify(body), 500
+    if status == "missing":
+        return jsonify(body), 404
+    return jsonify(body), 202
+
+
+@download_bp.route("/api/reports/<report_id>/export", methods=["POST"])
+def export_report(report_id):
+    """
+    Starts rendering a stored report as ?format=html|pdf (default pdf) in the background.
+    202 while it renders (poll GET on the same URL), 200 with the download URL once it is ready.
+    """
+    from services.report_store import load_report
+    from services.report_export import start_export, EXPORT_FORMATS
+    fmt = request.args.get("format", "pdf").lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unknown format, expected one of {', '.join(EXPORT_FORMATS)}"}), 400
+    report = load_report(report_id)
+    if report is None:
+        return jsonify({"error": "Report not found"}), 404
+    return export_response(report_id, fmt, start_export(report_id, report, fmt))
+
+
+@download_bp.route("/api/reports/<report_id>/export", methods=["GET"])
+def export_report_status(report_id):
+    from services.report_export import export_status, EXPORT_FORMATS
+    fmt = request.args.get("format", "pdf").lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unknown format, expected one of {', '.join(EXPORT_FORMATS)}"}), 400
+    return export_response(report_id, fmt, export_status(report_id, fmt))
+
+
+@download_bp.route("/api/export", methods=["POST"])
+def export():
+    """
+    Stores the report JSON in the body ({"report": {...}, "format": "pdf"}) and starts its export.
+    """
+    from services.report_store import save_report
+    from services.report_export import start_export, EXPORT_FORMATS
+    data = request.get_json(silent=True)
+    data = data if isinstance(data, dict) else {}
+    report = data.get("report")
+    fmt = str(data.get("format", "pdf")).lower()
+    if not isinstance(report, dict) or not report:
+        return jsonify({"error": "Expected a \"report\" object"}), 400
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unknown format, expected one of {', '.join(EXPORT_FORMATS)}"}), 400
+    report_id = save_report(report)
+    return export_response(report_id, fmt, start_export(report_id, report, fmt))
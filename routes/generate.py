@@ -1,21 +1,30 @@
 from flask import Blueprint, request, jsonify
 import time
-from controllers.report_generator import ReportGenerator
+from utils.lazy import Lazy
 
 generate_bp = Blueprint("generate", __name__)
 
-report_generator = ReportGenerator(verbose=True)
+
+def build_report_generator():
+    # Imported here so the app starts without loading langchain and the controllers
+    from controllers.report_generator import ReportGenerator
+    return ReportGenerator(verbose=True)
+
+
+report_generator = Lazy(build_report_generator)
 
 @generate_bp.route("/api/generate-report", methods=["POST"])
 def generate_report():
-    data = request.json
-    summary = data.get("summary", "")
+    data = request.get_json(silent=True)
+    summary = data.get("summary") if isinstance(data, dict) else None
+    if not isinstance(summary, dict):
+        return jsonify({"error": "Expected a \"summary\" object"}), 400
     # TODO: call LLM + data fetch logic
 
     # time.sleep(5)
     print(summary)
 
-    return jsonify(report_generator.generate_report(summary))
+    return jsonify(report_generator.get().generate_report(summary))
 
 
     return jsonify({
@@ -116,3 +125,30 @@ def generate_report():
     }
     })
 
+
+@generate_bp.route("/api/generate-reports", methods=["POST"])
+def generate_reports():
+    """
+    Bulk reports, e.g. a sector: {"summaries": [{"company": ..., "focusAreas": ..., ...}, ...]}.
+    Research shared by the companies is done once (see ReportGenerator.generate_reports).
+    """
+    data = request.get_json(silent=True)
+    summaries = data.get("summaries") if isinstance(data, dict) else None
+    if not isinstance(summaries, list) or not summaries or not all(isinstance(summary, dict) for summary in summaries):
+        return jsonify({"error": "Expected a non-empty \"summaries\" list of objects"}), 400
+
+    from services.report_store import save_report
+    reports = report_generator.get().generate_reports(summaries)
+    # Stored compactly; GET /api/reports/<id> renders them back as JSON
+    for report in reports:
+        report["id"] = save_report(report)
+    return jsonify({"reports": reports})
+
+
+@generate_bp.route("/api/reports/<report_id>", methods=["GET"])
+def get_report(report_id):
+    from services.report_store import load_report
+    report = load_report(report_id)
+    if report is None:
+        return jsonify({"error": "Report not found"}), 404
+    return jsonify(report)
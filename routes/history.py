@@ -1,8 +1,33 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 
 history_bp = Blueprint("history", __name__)
 
+
+def is_message(message) -> bool:
+    """
+    A chat message: {"role": ..., "parts": [{"text": ...}, ...]}.
+    """
+    parts = message.get("parts") if isinstance(message, dict) else None
+    return isinstance(parts, list) and all(isinstance(part, dict) and isinstance(part.get("text"), str) for part in parts)
+
+
 @history_bp.route("/api/history", methods=["GET"])
 def get_history():
-    # TODO: fetch from saved files or DB
-    return jsonify({"history": []})
+    conversation_id = request.args.get("conversation")
+    if not conversation_id:
+        return jsonify({"history": []})
+    from services.history_store import get_history_store
+    return jsonify({"conversation": conversation_id, "history": get_history_store().get(conversation_id)})
+
+
+@history_bp.route("/api/history", methods=["POST"])
+def save_history():
+    data = request.get_json(silent=True)
+    data = data if isinstance(data, dict) else {}
+    conversation_id = data.get("conversation")
+    messages = data.get("messages")
+    if not conversation_id or not isinstance(messages, list) or not all(map(is_message, messages)):
+        return jsonify({"error": "Expected \"conversation\" and a \"messages\" list of messages with text parts"}), 400
+    from services.history_store import get_history_store
+    get_history_store().put(conversation_id, messages)
+    return jsonify({"conversation": conversation_id, "saved": len(messages)})
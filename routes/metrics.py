@@ -0,0 +1,8 @@
+from flask import Blueprint, Response
+from services.metrics import render
+
+metrics_bp = Blueprint("metrics", __name__)
+
+@metrics_bp.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(render(), mimetype="text/plain; version=0.0.4")
@@ -1,17 +1,53 @@
-from flask import Blueprint, request, jsonify
-from controllers.query_parser import QueryParser
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from utils.lazy import Lazy
 
 query_bp = Blueprint("query", __name__)
-query_parser = QueryParser()
+
+
+def build_query_parser():
+    # Imported here so the app starts without loading langchain, genai and the controllers
+    from controllers.query_parser import QueryParser
+    return QueryParser()
+
+
+query_parser = Lazy(build_query_parser)
 
 @query_bp.route("/api/query", methods=["POST"])
 def query():
     messages = request.json.get("messages")
     query_summary = request.json.get("summary")
-    response = query_parser.handle_query(messages, query_summary)
+
+    # Streamed when asked for with "stream": true or an NDJSON / event-stream Accept header
+    accept = request.accept_mimetypes
+    if request.json.get("stream") or accept.best in ("application/x-ndjson", "text/event-stream"):
+        return stream_query(messages, query_summary, sse=accept.best == "text/event-stream")
+
+    response = query_parser.get().handle_query(messages, query_summary)
 
     print(response)
     return jsonify({
         "message": response,
         "summary": query_summary
-    })
\ No newline at end of file
+    })
+
+
+def stream_query(messages, query_summary, sse=False):
+    """
+    Streams the answer as it is generated: "token" events with text chunks, then a "final" event
+    with the same body the non-streamed endpoint returns (or an "error" event).
+    """
+    from services.streaming import run_streaming, format_ndjson, format_sse
+    formatter = format_sse if sse else format_ndjson
+
+    def events():
+        for event, value in run_streaming(query_parser.get().handle_query, messages, query_summary):
+            if event == "token":
+                yield formatter("token", {"text": value})
+            elif event == "final":
+                yield formatter("final", {"message": value, "summary": query_summary})
+            else:
+                yield formatter("error", {"message": value})
+
+    mimetype = "text/event-stream" if sse else "application/x-ndjson"
+    # Tell proxies not to buffer the stream
+    return Response(stream_with_context(events()), mimetype=mimetype, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,14 +1,25 @@
 from langchain_community.tools import DuckDuckGoSearchResults
 from langchain.agents import Tool, initialize_agent, AgentType
+from langchain.chains import LLMChain
+from langchain.prompts import PromptTemplate
+from langchain_core.agents import AgentAction
+from concurrent.futures import ThreadPoolExecutor, wait
 import yfinance as yf
 from dotenv import load_dotenv
+from services.data_parser import parse_list
+from services.callbacks import install_callbacks
+from services.rate_limit import limiter
+from services.singleflight import group
 import math
+import os
 import re
+import time
 import datetime
 import requests
 
 
 load_dotenv()
+install_callbacks()
 
 
 def get_stock_info(query: str) -> str:
@@ -44,7 +55,7 @@ def get_stock_info(query: str) -> str:
     if range_match:
         start_date, _, end_date = range_match.groups()
         try:
-            hist = stock.history(start=start_date, end=end_date)
+            hist = limiter("yfinance").call(stock.history, start=start_date, end=end_date)
             if hist.empty:
                 return f"No data found for {ticker} from {start_date} to {end_date}."
             summary = []
@@ -58,7 +69,7 @@ def get_stock_info(query: str) -> str:
     if dates:
         date = dates[0]
         try:
-            hist = stock.history(start=date, end=(datetime.datetime.strptime(date, "%Y-%m-%d") + datetime.timedelta(days=1)).strftime("%Y-%m-%d"))
+            hist = limiter("yfinance").call(stock.history, start=date, end=(datetime.datetime.strptime(date, "%Y-%m-%d") + datetime.timedelta(days=1)).strftime("%Y-%m-%d"))
             if hist.empty:
                 return f"No data found for {ticker} on {date}."
             row = hist.iloc[0]
@@ -70,7 +81,7 @@ def get_stock_info(query: str) -> str:
     if last_n_days:
         n = int(last_n_days.group(1))
         try:
-            hist = stock.history(period=f"{n}d")
+            hist = limiter("yfinance").call(stock.history, period=f"{n}d")
             if hist.empty:
                 return f"No data found for {ticker} for last {n} days."
             summary = []
@@ -103,7 +114,7 @@ def get_stock_info(query: str) -> str:
 
     info = None
     try:
-        info = stock.info
+        info = limiter("yfinance").call(lambda: stock.info)
     except Exception as e:
         return f"Error fetching data for {ticker}: {str(e)}"
 
@@ -180,10 +191,14 @@ def get_ticker_symbol(company_name: str) -> str:
     headers = {
         "User-Agent": "Mozilla/5.0"
     }
-    try:
-        response = requests.get(url, headers=headers)
+
+    def search():
+        response = requests.get(url, headers=headers, timeout=10)
         response.raise_for_status()
-        results = response.json()
+        return response.json()
+
+    try:
+        results = group("yahoo_search").do(company_name, limiter("yahoo_search").call, search)
         if results.get("quotes"):
             return results["quotes"][0].get("symbol", "Ticker not found")
         return "No ticker found"
@@ -201,17 +216,184 @@ ticker_lookup_tool = Tool(
 
 
 
-# Final-Web search agent
-def build_search_agent(llm, verbose=False):
+# Returned by langchain's AgentExecutor when it stops on max_iterations / max_execution_time
+STOPPED_OUTPUT = "Agent stopped due to iteration limit or time limit."
+# Returned by run_search_agent when a stopped agent has nothing useful to fall back to
+NO_ANSWER_OUTPUT = "Sorry, I couldn't find a complete answer in time. Please try a more specific question."
+
+
+class PartialAnswer(str):
+    """
+    A fallback answer from a stopped agent (a raw tool observation), not a final answer.
+    It reads as plain text but should not be cached.
+    """
+
+
+class AgentPolicy:
+    """
+    Execution limits for the search agent.
+    - max_steps: maximum number of thought/tool cycles (unparsable LLM outputs count as steps)
+    - max_seconds: wall-clock deadline for the whole run, checked between steps
+    - max_tokens: cap on output tokens for every LLM call the agent makes
+    - fallback: what to answer with when a limit is hit
+        "partial"  -> the last useful tool observation, no extra LLM call
+        "generate" -> one final LLM call over the steps taken so far
+    """
+
+    def __init__(self, max_steps=None, max_seconds=None, max_tokens=None, fallback="partial"):
+        self.max_steps = max_steps or int(os.getenv("AGENT_MAX_STEPS", 6))
+        self.max_seconds = max_seconds or float(os.getenv("AGENT_MAX_SECONDS", 30))
+        self.max_tokens = max_tokens or (int(os.getenv("AGENT_MAX_TOKENS")) if os.getenv("AGENT_MAX_TOKENS") else None)
+        if fallback not in ("partial", "generate"):
+            raise ValueError(f"Unknown agent fallback: {fallback}")
+        self.fallback = fallback
+
+
+PLAN_PROMPT = PromptTemplate(
+    input_variables=["tools", "question", "max_calls"],
+    template=(
+        "You are a financial research planner. Break the question below into independent tool calls "
+        "that can all run at the same time (e.g. one call per company and metric).\n\n"
+        "Available tools:\n{tools}\n\n"
+        "Question:\n{question}\n\n"
+        "Use at most {max_calls} tool calls. A call must not depend on the output of another call.\n"
+        "Return ONLY a JSON list of objects with the tool name and its input, e.g.:\n"
+        '[{{"tool": "Yahoo Finance (Advanced)", "input": "INFY market cap"}}, {{"tool": "DuckDuckGo Search", "input": "TCS revenue FY2025"}}]\n'
+    )
+)
+
+SYNTHESIS_PROMPT = PromptTemplate(
+    input_variables=["question", "observations"],
+    template=(
+        "You are a financial expert. Answer the question using ONLY the tool results below.\n\n"
+        "Question:\n{question}\n\n"
+        "Tool results:\n{observations}\n\n"
+        "If some information is missing, say so instead of guessing. Keep the answer concise and to the point.\n"
+    )
+)
+
+
+class PlanExecuteAgent:
+    """
+    Search agent for multi-entity questions:
+    1. One LLM call plans independent tool calls
+    2. The tool calls run concurrently
+    3. One LLM call synthesises the answer from all the results
+    Falls back to the ReAct agent when no usable plan is produced.
+    Exposes the same invoke() contract as langchain's AgentExecutor.
+    """
+
+    def __init__(self, llm, tools, policy, fallback_agent, verbose=False):
+        self.tools = {tool.name: tool for tool in tools}
+        self.policy = policy
+        self.fallback_agent = fallback_agent
+        self.verbose = verbose
+        self.plan_chain = LLMChain(llm=llm, prompt=PLAN_PROMPT, output_key="plan")
+        self.synthesis_chain = LLMChain(llm=llm, prompt=SYNTHESIS_PROMPT, output_key="answer")
+
+    def plan(self, question: str) -> list:
+        """
+        Returns a list of (tool, input) pairs for known tools, capped at policy.max_steps.
+        """
+        tools = "\n".join(f"- {tool.name}: {tool.description}" for tool in self.tools.values())
+        raw_plan = self.plan_chain.run({"tools": tools, "question": question, "max_calls": self.policy.max_steps})
+        steps = []
+        for step in parse_list(raw_plan) or []:
+            if isinstance(step, dict) and step.get("tool") in self.tools and step.get("input"):
+                steps.append((step["tool"], str(step["input"])))
+        if self.verbose:
+            print("[AGENT] Plan:", steps)
+        return steps[:self.policy.max_steps]
+
+    def invoke(self, inputs: dict) -> dict:
+        question = inputs["input"]
+        start = time.time()
+
+        steps = self.plan(question)
+        if not steps:
+            # The fallback gets what is left of the budget, not a fresh one; copied, as the agent is shared by requests
+            remaining = self.policy.max_seconds - (time.time() - start)
+            if remaining <= 0:
+                return {"output": STOPPED_OUTPUT, "intermediate_steps": []}
+            return self.fallback_agent.model_copy(update={"max_execution_time": remaining}).invoke(inputs)
+
+        executor = ThreadPoolExecutor(max_workers=len(steps))
+        futures = {executor.submit(self.tools[tool].run, tool_input): (tool, tool_input) for tool, tool_input in steps}
+        done, _ = wait(futures, timeout=max(0.0, self.policy.max_seconds - (time.time() - start)))
+        # Do not block on tool calls that missed the deadline
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        intermediate_steps = []
+        for future, (tool, tool_input) in futures.items():
+            if future in done and future.exception() is None:
+                action = AgentAction(tool=tool, tool_input=tool_input, log="")
+                intermediate_steps.append((action, str(future.result())))
+        if self.verbose:
+            print(f"[AGENT] {len(intermediate_steps)}/{len(steps)} tool calls finished")
+        if not intermediate_steps:
+            return {"output": STOPPED_OUTPUT, "intermediate_steps": []}
+
+        observations = "\n\n".join(
+            f"[{action.tool}] {action.tool_input}:\n{observation}" for action, observation in intermediate_steps
+        )
+        answer = self.synthesis_chain.run({"question": question, "observations": observations})
+        return {"output": answer, "intermediate_steps": intermediate_steps}
+
+
+def build_search_tools():
     search = DuckDuckGoSearchResults()
-    tools = [
-        Tool(name="DuckDuckGo Search", func=search.run, description="Search the web for financial info"),
+    return [
+        Tool(name="DuckDuckGo Search", func=lambda query: group("duckduckgo").do(query, limiter("duckduckgo").call, search.run, query), description="Search the web for financial info"),
         ticker_lookup_tool,
         yfinance_tool,
         math_tool,
     ]
-    return initialize_agent(
-        tools=tools, llm=llm, agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION, verbose=verbose, handle_parsing_errors=True
+
+
+# Final-Web search agent
+def build_search_agent(llm, verbose=False, policy=None, mode=None):
+    """
+    Builds the web search agent.
+    - mode "react": langchain ReAct agent, one tool call per LLM round trip (default)
+    - mode "plan": PlanExecuteAgent, concurrent tool calls between one planning and one synthesis call
+    The default mode can be set with the SEARCH_AGENT_MODE environment variable.
+    """
+    policy = policy or AgentPolicy()
+    mode = mode or os.getenv("SEARCH_AGENT_MODE", "react")
+    if policy.max_tokens:
+        llm = llm.model_copy(update={"max_output_tokens": policy.max_tokens})
+
+    tools = build_search_tools()
+    react_agent = initialize_agent(
+        tools=tools,
+        llm=llm,
+        agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+        verbose=verbose,
+        handle_parsing_errors=True,
+        max_iterations=policy.max_steps,
+        max_execution_time=policy.max_seconds,
+        early_stopping_method="generate" if policy.fallback == "generate" else "force",
+        return_intermediate_steps=True,
     )
+    if mode == "react":
+        return react_agent
+    if mode == "plan":
+        return PlanExecuteAgent(llm, tools, policy, fallback_agent=react_agent, verbose=verbose)
+    raise ValueError(f"Unknown search agent mode: {mode}")
+
 
+def run_search_agent(agent, query: str) -> str:
+    """
+    Runs the search agent and returns its answer.
+    If the agent was stopped by its policy, falls back to the best partial answer,
+    i.e. the last tool observation that is not a parsing error, returned as a PartialAnswer.
+    """
+    result = agent.invoke({"input": query})
+    output = result.get("output", "")
+    if output != STOPPED_OUTPUT:
+        return output
 
+    for action, observation in reversed(result.get("intermediate_steps", [])):
+        if action.tool != "_Exception" and str(observation).strip():
+            return PartialAnswer(observation)
+    return NO_ANSWER_OUTPUT
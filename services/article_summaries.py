@@ -0,0 +1,52 @@
+"""
+Persisted per-article news summaries.
+
+Summaries are keyed by the article URL and a hash of its content, so an article is summarised
+once and reused by every later news request (and digest refresh) until it changes or the entry
+expires after ARTICLE_SUMMARY_TTL seconds. Bump ARTICLE_SUMMARY_VERSION when the article prompt
+changes, so summaries written with the old prompt are not reused.
+"""
+import os
+import hashlib
+from services.cache import CACHE_DIR, DiskCache
+from services.storage import encode, decode, is_encoded
+
+ARTICLE_SUMMARY_TTL = float(os.getenv("ARTICLE_SUMMARY_TTL", 7 * 24 * 60 * 60))
+ARTICLE_SUMMARY_DB = os.path.join(CACHE_DIR, "article_summaries.sqlite")
+ARTICLE_SUMMARY_VERSION = 1
+
+
+def article_key(url: str, content: str) -> str:
+    url_hash = hashlib.sha256((url or "").encode("utf-8")).hexdigest()
+    content_hash = hashlib.sha256((content or "").encode("utf-8")).hexdigest()
+    return f"v{ARTICLE_SUMMARY_VERSION}:{url_hash}:{content_hash}"
+
+
+class ArticleSummaryStore:
+    """
+    Article summaries by article_key(url, content), shared by all workers through a SQLite file.
+    """
+
+    def __init__(self, path: str = ARTICLE_SUMMARY_DB, ttl: float = ARTICLE_SUMMARY_TTL):
+        self.cache = DiskCache(path, ttl=ttl)
+
+    def get_many(self, keys: list) -> dict:
+        # Summaries stored before the storage format are plain UTF-8 text
+        return {
+            key: decode(value, "document") if is_encoded(value) else bytes(value).decode("utf-8")
+            for key, value in self.cache.get_many(keys).items()
+        }
+
+    def put_many(self, summaries: dict):
+        if summaries:
+            self.cache.set_many({key: encode(summary, "document") for key, summary in summaries.items()})
+
+
+_store = None
+
+
+def get_article_store() -> ArticleSummaryStore:
+    global _store
+    if _store is None:
+        _store = ArticleSummaryStore()
+    return _store
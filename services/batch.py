@@ -0,0 +1,211 @@
+"""
+Batch processing of chat queries, for prompt regression runs and nightly precomputation.
+
+Input is JSONL, one query per line:
+    {"id": "q1", "query": "What is the P/E ratio?"}
+    {"id": "q2", "messages": [{"role": "user", "parts": [{"text": "..."}]}], "summary": {...}}
+("id" defaults to the line number). Identical queries (same messages and summary) are answered
+once, and every copy gets the answer. At most BATCH_CONCURRENCY queries run at a time through one
+QueryParser, so they share its caches, rate limits and in-flight calls.
+
+Results are written as they complete, one JSON line per input line:
+    {"id", "message", "summary", "error", "elapsed_ms", "duplicate_of"}
+The output file doubles as the checkpoint: rerunning with the same output skips ids that already
+have an answer and retries the ones that failed.
+
+    python -m services.batch queries.jsonl -o results.jsonl
+    python -m services.batch queries.jsonl -o results.jsonl --concurrency 16
+    cat queries.jsonl | python -m services.batch - -o results.jsonl --restart
+
+The same runner backs POST /api/batch (see routes/batch.py).
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+
+
+class BatchItem:
+
+    def __init__(self, item_id: str, messages: list = None, summary=None, error: str = None):
+        self.id = item_id
+        self.messages = messages or []
+        self.summary = summary
+        self.error = error
+
+    @property
+    def key(self) -> str:
+        """
+        Identity of the query: the conversation and the query summary, whitespace-insensitive.
+        """
+        payload = json.dumps([self.messages, self.summary], sort_keys=True, default=str)
+        return hashlib.sha256(" ".join(payload.split()).encode("utf-8")).hexdigest()
+
+
+def parse_item(data, line_number: int) -> BatchItem:
+    """
+    Builds a BatchItem from one decoded input object; invalid input gives an item carrying the error.
+    """
+    if not isinstance(data, dict):
+        return BatchItem(str(line_number), error="Expected a JSON object")
+    item_id = str(data.get("id", line_number))
+    messages = data.get("messages")
+    if messages is None and data.get("query"):
+        messages = [{"role": "user", "parts": [{"text": str(data["query"])}]}]
+    if not isinstance(messages, list) or not messages:
+        return BatchItem(item_id, error='Expected "query" or a non-empty "messages" list')
+    return BatchItem(item_id, messages, data.get("summary"))
+
+
+def read_items(lines):
+    """
+    Yields BatchItems from JSONL lines, skipping blank lines.
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            yield BatchItem(str(line_number), error=f"Invalid JSON: {e}")
+            continue
+        yield parse_item(data, line_number)
+
+
+def result_for(item: BatchItem, message=None, error: str = None, elapsed_ms: float = 0.0, duplicate_of: str = None) -> dict:
+    return {
+        "id": item.id,
+        "message": message,
+        "summary": item.summary,
+        "error": error,
+        "elapsed_ms": round(elapsed_ms, 1),
+        "duplicate_of": duplicate_of,
+    }
+
+
+def run_batch(items, handle, concurrency: int = BATCH_CONCURRENCY, skip_ids: set = None):
+    """
+    Runs handle(messages, summary) for each distinct item with at most `concurrency` in flight,
+    yielding one result per item as soon as it is known (completion order, not input order).
+    Items are read lazily, so the input can be larger than memory.
+    """
+    skip_ids = skip_ids or set()
+    answered = {}  # key -> result of the first item with that key
+    waiting = {}   # key -> items that arrived while the first one was running
+    running = {}   # future -> item
+
+    def call(item):
+        start = time.perf_counter()
+        try:
+            message, error = handle(item.messages, item.summary), None
+        except Exception as e:
+            message, error = None, f"{type(e).__name__}: {e}"
+        return message, error, (time.perf_counter() - start) * 1000
+
+    def finish(done):
+        for future in done:
+            item = running.pop(future)
+            message, error, elapsed_ms = future.result()
+            result = result_for(item, message, error, elapsed_ms)
+            if error is None:
+                answered[item.key] = result
+            yield result
+            for duplicate in waiting.pop(item.key, []):
+                yield result_for(duplicate, message, error, duplicate_of=item.id)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as executor:
+        for item in items:
+            if item.id in skip_ids:
+                continue
+            if item.error:
+                yield result_for(item, error=item.error)
+                continue
+
+            key = item.key
+            if key in answered:
+                yield result_for(item, answered[key]["message"], duplicate_of=answered[key]["id"])
+                continue
+            if key in waiting:
+                waiting[key].append(item)
+                continue
+
+            while len(running) >= concurrency:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                yield from finish(done)
+            waiting[key] = []
+            running[executor.submit(call, item)] = item
+
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            yield from finish(done)
+
+
+def load_checkpoint(path: str) -> set:
+    """
+    Returns the ids already answered in an existing output file.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # A line cut short by an interrupted run
+                continue
+            if result.get("error") is None:
+                done.add(result.get("id"))
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run chat queries in bulk from a JSONL file")
+    parser.add_argument("input", help="JSONL file of queries, or - for stdin")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file the results are appended to; also the checkpoint")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--restart", action="store_true", help="Ignore earlier results in the output file and start over")
+    args = parser.parse_args()
+
+    if args.restart and os.path.exists(args.output):
+        os.remove(args.output)
+    skip_ids = load_checkpoint(args.output)
+    if skip_ids:
+        print(f"Resuming: {len(skip_ids)} queries already answered in {args.output}", file=sys.stderr)
+
+    from controllers.query_parser import QueryParser
+    query_parser = QueryParser()
+
+    counts = {"answered": 0, "duplicates": 0, "errors": 0}
+    start = time.perf_counter()
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    try:
+        with open(args.output, "a", encoding="utf-8") as out:
+            for result in run_batch(read_items(source), query_parser.handle_query, args.concurrency, skip_ids):
+                out.write(json.dumps(result, default=str) + "\n")
+                # Flushed per line, so an interrupted run loses at most the queries in flight
+                out.flush()
+                if result["error"] is not None:
+                    counts["errors"] += 1
+                elif result["duplicate_of"] is not None:
+                    counts["duplicates"] += 1
+                else:
+                    counts["answered"] += 1
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+    print(
+        f"{counts['answered']} answered, {counts['duplicates']} duplicates, {counts['errors']} errors "
+        f"in {time.perf_counter() - start:.1f}s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Local directory for on-disk caches
+CACHE_DIR = os.getenv("CACHE_DIR", "./.cache")
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU cache with an optional time-to-live (in seconds) per entry.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        return item[0] if item else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DiskCache:
+    """
+    Process-safe key/value store of bytes in a local SQLite file, with an optional time-to-live.
+    Each thread gets its own connection; WAL mode lets several workers read while one writes.
+    """
+
+    def __init__(self, path: str, ttl: float = None):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        # SQLite connections must not be shared with a forked child
+        os.register_at_fork(after_in_child=self._forget_connections)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)")
+
+    def _forget_connections(self):
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: list) -> dict:
+        found = {}
+        now = time.time()
+        conn = self._connection()
+        # Stay well below SQLite's limit on bound parameters
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = conn.execute(
+                f"SELECT key, value, expires_at FROM cache WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for key, value, expires_at in rows:
+                if expires_at is None or expires_at >= now:
+                    found[key] = value
+        return found
+
+    def set(self, key: str, value: bytes, ttl: float = None):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items: dict, ttl: float = None):
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.time() + ttl if ttl else None
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                [(key, value, expires_at) for key, value in items.items()],
+            )
+
+    def add(self, key: str, value: bytes, ttl: float = None) -> bool:
+        """
+        Stores the value only if the key is absent or expired. Returns whether it was stored,
+        which makes the key usable as a cross-process lease.
+        """
+        ttl = ttl if ttl is not None else self.ttl
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute("DELETE FROM cache WHERE key = ? AND expires_at IS NOT NULL AND expires_at < ?", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, now + ttl if ttl else None),
+            )
+        return cursor.rowcount == 1
+
+    def delete(self, key: str):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def purge_expired(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
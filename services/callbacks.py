@@ -0,0 +1,70 @@
+import time
+from contextvars import ContextVar
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+from services.metrics import record_stage, record_tokens, registry, AGENT_STEPS
+from services.rate_limit import RateLimitCallbackHandler
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Records every langchain LLM call, tool call and agent step.
+    """
+
+    def __init__(self):
+        self._runs = {}
+
+    def _start(self, run_id, stage, **labels):
+        self._runs[run_id] = (stage, labels, time.perf_counter())
+
+    def _end(self, run_id, status="ok"):
+        started = self._runs.pop(run_id, None)
+        if started:
+            stage, labels, start = started
+            record_stage(stage, time.perf_counter() - start, status, **labels)
+        return started
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, "llm", model=(metadata or {}).get("ls_model_name", "unknown"))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._start(run_id, "llm", model=(metadata or {}).get("ls_model_name", "unknown"))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._end(run_id)
+        model = started[1]["model"] if started else "unknown"
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                record_tokens(model, usage.get("input_tokens", 0), usage.get("output_tokens", 0))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, "error")
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, "tool", tool=(serialized or {}).get("name", "unknown"))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, "error")
+
+    def on_agent_action(self, action, *, run_id, **kwargs):
+        registry.inc(AGENT_STEPS, tool=action.tool)
+
+
+_installed = False
+
+
+def install_callbacks():
+    """
+    Attaches the callback handlers to every langchain run in the process. Safe to call repeatedly.
+    """
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    # The default value makes the handler visible from every thread
+    register_configure_hook(ContextVar("insightz_metrics_callback", default=MetricsCallbackHandler()), inheritable=True)
+    register_configure_hook(ContextVar("insightz_rate_limit_callback", default=RateLimitCallbackHandler()), inheritable=True)
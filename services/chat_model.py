@@ -0,0 +1,29 @@
+from typing import Tuple
+from langchain_core.language_models.chat_models import generate_from_stream
+from langchain_google_genai import ChatGoogleGenerativeAI
+from services.streaming import current_sink
+
+
+class ChatModel(ChatGoogleGenerativeAI):
+    """
+    ChatGoogleGenerativeAI for calls that produce the user-facing answer.
+    With stream_to_sink set and a token sink active (a streamed request), the response is
+    streamed and each chunk is written to the sink; langchain's on_llm_new_token callbacks fire as usual.
+    Answers listed in withhold (e.g. "No" meaning "not found") are never streamed.
+    """
+
+    stream_to_sink: bool = False
+    withhold: Tuple[str, ...] = ()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        sink = current_sink()
+        if not self.stream_to_sink or sink is None:
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        writer = sink.writer(self.withhold)
+        chunks = []
+        for chunk in self._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            writer.write(chunk.text)
+            chunks.append(chunk)
+        writer.finish()
+        return generate_from_stream(iter(chunks))
@@ -1,5 +1,6 @@
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
+from services.metrics import span
 
 
 def build_query_refiner_chain(llm):
@@ -39,7 +40,8 @@ def contextualize_user_query(llm, history, user_query):
     Formats history, runs the query refiner chain, and returns the refined query.
     """
 
-    formatted_history = format_history(history)
-    query_refiner_chain = build_query_refiner_chain(llm)
-    result = query_refiner_chain.run({"history": formatted_history, "user_query": user_query})
+    with span("contextualize"):
+        formatted_history = format_history(history)
+        query_refiner_chain = build_query_refiner_chain(llm)
+        result = query_refiner_chain.run({"history": formatted_history, "user_query": user_query})
     return result
@@ -1,81 +1,247 @@
-import json
+"""
+Extraction of JSON objects and lists from LLM output.
+
+The output is scanned once, left to right, for the first balanced {...} or [...] that parses,
+skipping anything around it (markdown fences, #### delimiters, prose). At each opening bracket
+the C JSON decoder is tried first, so valid JSON is parsed in the same pass that finds it. Only
+a span it rejects is delimited by a bracket scanner, which ignores brackets inside strings. With
+repair=True, such a candidate is fixed up before giving up on it: single-quoted strings, Python
+literals, trailing commas, // comments, and brackets left open by a truncated response.
+"""
 import re
+import ast
+import json
+
+OPENERS = {"{": "}", "[": "]"}
+CLOSERS = {"}": "{", "]": "["}
+QUOTES = ("\"", "'")
+PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+# The only characters the scanner acts on; the text between them is skipped by the regex engine
+TOKENS = re.compile(r"[{}\[\]\"'\\]")
+OPENER_PATTERNS = {"{": re.compile(r"\{"), "[": re.compile(r"\["), "{[": re.compile(r"[{\[]")}
+_decoder = json.JSONDecoder()
 
-def parse_json(raw_output):
+
+def scan_span(text, start):
+    """
+    Finds the end of the bracketed span opening at start, visiting only brackets, quotes and backslashes.
+    Returns (end, status): status is "complete" (end is past the closing bracket), "mismatched" (end is
+    past the offending bracket) or "open" (the text ends inside the span).
+    """
+    stack = []
+    quote = None
+    escaped_at = -1
+
+    for match in TOKENS.finditer(text, start):
+        i = match.start()
+        char = text[i]
+        if quote:
+            if i == escaped_at:
+                continue
+            if char == "\\":
+                escaped_at = i + 1
+            elif char == quote:
+                quote = None
+            continue
+
+        if char in QUOTES:
+            # An apostrophe directly after a letter is prose ("company's"), not a string delimiter
+            if char == "'" and text[i - 1].isalnum():
+                continue
+            quote = char
+        elif char in OPENERS:
+            stack.append(char)
+        elif char in CLOSERS:
+            if stack[-1] != CLOSERS[char]:
+                return i + 1, "mismatched"
+            stack.pop()
+            if not stack:
+                return i + 1, "complete"
+
+    return len(text), "open"
+
+
+def iter_candidates(text, openers="{["):
+    """
+    Yields (candidate, complete, value) for each top-level bracketed span starting with one of the
+    openers, in order. complete is False for a trailing span left open at the end of the text.
+    A span that is valid JSON is decoded straight from the text by the C decoder and comes with its
+    value; only spans that are not are scanned bracket by bracket, and come with value None.
+    """
+    opener = OPENER_PATTERNS.get(openers) or re.compile("[" + re.escape(openers) + "]")
+    pos = 0
+    while True:
+        match = opener.search(text, pos)
+        if match is None:
+            return
+        start = match.start()
+        try:
+            value, pos = _decoder.raw_decode(text, start)
+            yield text[start:pos], True, value
+            continue
+        except (ValueError, RecursionError):
+            pass
+        pos, status = scan_span(text, start)
+        if status == "complete":
+            yield text[start:pos], True, None
+        elif status == "open":
+            yield text[start:], False, None
+            return
+        # A mismatched bracket means the span is not JSON: look for the next one
+
+
+def repair_json(candidate, complete=True):
+    """
+    Rewrites JSON-like text into valid JSON in one pass: single-quoted strings become
+    double-quoted, True/False/None become true/false/null, // comments and trailing commas
+    are dropped, and (for incomplete candidates) open strings and brackets are closed.
+    """
+    out = []
+    stack = []
+    quote = None
+    escaped = False
+    i = 0
+    n = len(candidate)
+
+    while i < n:
+        char = candidate[i]
+
+        if quote:
+            if escaped:
+                escaped = False
+                out.append(char)
+            elif char == "\\":
+                escaped = True
+                out.append(char)
+            elif char == quote:
+                quote = None
+                out.append("\"")
+            elif char == "\"" and quote == "'":
+                out.append("\\\"")
+            elif char == "\n":
+                out.append("\\n")
+            else:
+                out.append(char)
+            i += 1
+            continue
+
+        if char in QUOTES:
+            quote = char
+            out.append("\"")
+        elif char == "/" and candidate.startswith("//", i):
+            newline = candidate.find("\n", i)
+            i = n if newline == -1 else newline
+            continue
+        elif char in OPENERS:
+            stack.append(OPENERS[char])
+            out.append(char)
+        elif char in CLOSERS:
+            # Drop a trailing comma before the closing bracket
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(char)
+        elif char.isalpha():
+            end = i
+            while end < n and (candidate[end].isalnum() or candidate[end] == "_"):
+                end += 1
+            word = candidate[i:end]
+            out.append(PY_LITERALS.get(word, word))
+            i = end
+            continue
+        else:
+            out.append(char)
+        i += 1
+
+    if not complete:
+        if quote:
+            out.append("\"")
+        while out and (out[-1].isspace() or out[-1] in ",:"):
+            out.pop()
+        out.extend(reversed(stack))
+    return "".join(out)
+
+
+def _load(candidate, complete, repair):
+    """
+    Parses a candidate the JSON decoder rejected, after repair; None if that fails too.
+    """
+    if not repair:
+        return None
+    try:
+        return json.loads(repair_json(candidate, complete))
+    except (ValueError, RecursionError):
+        pass
+    try:
+        return ast.literal_eval(candidate)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+
+def extract_json(raw_output, openers="{[", repair=True, expected_type=None):
+    """
+    Returns the first bracketed value in the text that parses (optionally of the expected type), or None.
+    """
+    if not raw_output:
+        return None
+    for candidate, complete, value in iter_candidates(raw_output, openers):
+        if value is None:
+            value = _load(candidate, complete, repair)
+        if value is not None and (expected_type is None or isinstance(value, expected_type)):
+            return value
+    return None
+
+
+def first_dict(value):
+    """
+    Returns the first object nested in a list, in document order, or None.
+    """
+    for item in value:
+        if isinstance(item, dict):
+            return item
+        if isinstance(item, list):
+            nested = first_dict(item)
+            if nested is not None:
+                return nested
+    return None
+
+
+def parse_json(raw_output, repair=True):
     """
     Parse  JSON or JSON-like string from LLM output.
     Handles cases with markdown (```json ... ```), ####, '''json, or direct JSON.
-    Returns a dict or None if parsing fails.
-    """
-    # 1. Remove markdown/code block wrappers
-    cleaned = raw_output.strip()
-    # Remove ```json ... ```
-    cleaned = re.sub(r"```json(.*?)```", r"\1", cleaned, flags=re.DOTALL | re.IGNORECASE)
-    # Remove ``` ... ```
-    cleaned = re.sub(r"```(.*?)```", r"\1", cleaned, flags=re.DOTALL)
-    # Remove #### ... ####
-    cleaned = re.sub(r"#+\s*json\s*", "", cleaned, flags=re.IGNORECASE)
-    cleaned = re.sub(r"#+", "", cleaned)
-    # Remove '''json ... '''
-    cleaned = re.sub(r"'''json(.*?)'''", r"\1", cleaned, flags=re.DOTALL | re.IGNORECASE)
-    cleaned = re.sub(r"'''(.*?)'''", r"\1", cleaned, flags=re.DOTALL)
-    # Remove leading/trailing whitespace and newlines
-    cleaned = cleaned.strip()
-
-    # 2. Try to find the first {...} JSON object in the string
-    match = re.search(r"\{.*\}", cleaned, flags=re.DOTALL)
-    if match:
-        cleaned = match.group(0)
-
-    # 3. Try parsing
-    try:
-        return json.loads(cleaned)
-    except Exception as e:
-        # Try to fix common issues (single quotes, trailing commas)
-        fixed = cleaned.replace("'", '"')
-        fixed = re.sub(r",\s*}", "}", fixed)
-        fixed = re.sub(r",\s*]", "]", fixed)
-        try:
-            return json.loads(fixed)
-        except Exception as e2:
-            return None
+    Returns the first JSON object (or, if there is none, the first JSON array), or None if parsing fails.
+    Objects and arrays are looked for in the same pass; an object nested in an array counts.
+    """
+    if not raw_output:
+        return None
+    first_list = None
+    for candidate, complete, value in iter_candidates(raw_output, "{["):
+        if value is None:
+            value = _load(candidate, complete, repair)
+        if isinstance(value, dict):
+            return value
+        if isinstance(value, list):
+            nested = first_dict(value)
+            if nested is not None:
+                return nested
+            if first_list is None:
+                first_list = value
+        elif candidate[0] == "[":
+            # An array that does not parse may still hold an object that does
+            nested = extract_json(candidate[1:], "{", repair, dict)
+            if nested is not None:
+                return nested
+    return first_list
 
 
-def parse_list(raw_output):
+def parse_list(raw_output, repair=True):
     """
     Parse a Python list from LLM output.
     Handles direct lists, markdown/code blocks (```python ... ```), and other wrappers.
     Returns a Python list or None if parsing fails.
     """
-    cleaned = raw_output.strip()
-    # Remove ```python ... ```
-    cleaned = re.sub(r"```python(.*?)```", r"\1", cleaned, flags=re.DOTALL | re.IGNORECASE)
-    # Remove ``` ... ```
-    cleaned = re.sub(r"```(.*?)```", r"\1", cleaned, flags=re.DOTALL)
-    # Remove '''python ... '''
-    cleaned = re.sub(r"'''python(.*?)'''", r"\1", cleaned, flags=re.DOTALL | re.IGNORECASE)
-    cleaned = re.sub(r"'''(.*?)'''", r"\1", cleaned, flags=re.DOTALL)
-    # Remove #### ... ####
-    cleaned = re.sub(r"#+\s*python\s*", "", cleaned, flags=re.IGNORECASE)
-    cleaned = re.sub(r"#+", "", cleaned)
-    cleaned = cleaned.strip()
-
-    # Try to find the first [...] list in the string
-    match = re.search(r"\[.*\]", cleaned, flags=re.DOTALL)
-    if match:
-        cleaned = match.group(0)
-
-    # Try parsing as JSON list
-    try:
-        return json.loads(cleaned)
-    except Exception:
-        # Try to eval as Python list (safe)
-        try:
-            import ast
-            result = ast.literal_eval(cleaned)
-            if isinstance(result, list):
-                return result
-        except Exception:
-            return
-
-
+    return extract_json(raw_output, "[", repair, list)
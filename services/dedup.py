@@ -0,0 +1,98 @@
+"""
+Near-duplicate detection for downloaded articles.
+
+Syndicated news puts the same wire story under many URLs. Each text gets a MinHash signature over
+its word shingles; two signatures agreeing in a fraction f of positions estimate a Jaccard
+similarity of f between the shingle sets. Texts at or above DEDUP_THRESHOLD join the cluster of
+the first text they match, and each cluster is represented by its longest text (usually the
+complete copy). Dropped copies are counted in insightz_near_duplicates_total by source.
+
+Batches are small (tens of pages), so texts are compared with each cluster directly; no LSH index.
+"""
+import os
+import re
+import zlib
+import numpy as np
+from services.metrics import registry, NEAR_DUPLICATES
+
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", 0.8))
+SHINGLE_SIZE = 5
+NUM_PERMUTATIONS = 128
+# Only the start of long pages is compared; copies of a story share it
+MAX_SIGNATURE_CHARS = 20_000
+
+# Universal hashing (a * x + b) mod p over 32-bit shingle hashes; fixed seed, so signatures are stable
+_PRIME = np.uint64((1 << 61) - 1)
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, 1 << 32, NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 32, NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def shingles(text: str) -> np.ndarray:
+    """
+    32-bit hashes of the distinct SHINGLE_SIZE-word windows of the text.
+    """
+    words = re.findall(r"\w+", text[:MAX_SIGNATURE_CHARS].lower())
+    if len(words) < SHINGLE_SIZE:
+        windows = {" ".join(words)}
+    else:
+        windows = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    return np.fromiter((zlib.crc32(w.encode("utf-8")) for w in windows), dtype=np.uint64, count=len(windows))
+
+
+def signature(text: str) -> np.ndarray:
+    hashes = shingles(text)
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    Estimated Jaccard similarity of the texts behind two signatures.
+    """
+    return float(np.mean(a == b))
+
+
+def cluster(items: list, text=lambda item: item.page_content, threshold: float = None) -> list:
+    """
+    Groups near-identical items, in order of first appearance. Each cluster is a list whose
+    first element is its representative (the longest text).
+    """
+    threshold = DEDUP_THRESHOLD if threshold is None else threshold
+    clusters = []
+    signatures = []
+    for item in items:
+        item_signature = signature(text(item) or "")
+        for i, cluster_signature in enumerate(signatures):
+            if similarity(item_signature, cluster_signature) >= threshold:
+                clusters[i].append(item)
+                break
+        else:
+            clusters.append([item])
+            signatures.append(item_signature)
+    return [sorted(members, key=lambda item: -len(text(item) or "")) for members in clusters]
+
+
+def deduplicate(items: list, text=lambda item: item.page_content, threshold: float = None, source: str = "news") -> list:
+    """
+    Keeps one representative per cluster of near-identical items, in order of first appearance.
+    """
+    items = list(items)
+    representatives = [members[0] for members in cluster(items, text, threshold)]
+    if len(representatives) < len(items):
+        registry.inc(NEAR_DUPLICATES, len(items) - len(representatives), source=source)
+    return representatives
+
+
+def canonical_keys(texts: dict, threshold: float = None, source: str = "report") -> dict:
+    """
+    Maps each key of {key: text} to the key of its cluster's representative. Empty texts map to themselves.
+    """
+    canonical = {key: key for key in texts}
+    clusters = cluster([(key, text) for key, text in texts.items() if text], lambda item: item[1], threshold)
+    for members in clusters:
+        for key, _ in members:
+            canonical[key] = members[0][0]
+    duplicates = sum(len(members) - 1 for members in clusters)
+    if duplicates:
+        registry.inc(NEAR_DUPLICATES, duplicates, source=source)
+    return canonical
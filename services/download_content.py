@@ -1,48 +1,139 @@
+"""
+Page downloads for news summaries and reports, with bounded memory per page.
+
+- One streamed GET per URL (no separate validity check); the body is read in chunks and
+  abandoned past DOWNLOAD_MAX_BYTES, and Content-Length is checked before reading anything.
+- Only HTML and plain text are parsed; PDFs go to a PDF extractor (needs pypdf), anything else
+  is skipped.
+- Extracted text is cut to DOWNLOAD_MAX_CHARS.
+- iter_documents() yields documents one at a time, so callers that stream them never hold the
+  whole result set.
+"""
+import io
+import os
 import requests
 from bs4 import BeautifulSoup
+from langchain_core.documents import Document
+from services.metrics import span
+from services.singleflight import group
+
+DOWNLOAD_MAX_BYTES = int(os.getenv("DOWNLOAD_MAX_BYTES", 2 * 1024 * 1024))
+DOWNLOAD_MAX_CHARS = int(os.getenv("DOWNLOAD_MAX_CHARS", 100_000))
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", 10))
+CHUNK_SIZE = 64 * 1024
+HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
+
+HTML_TYPES = ("text/html", "application/xhtml+xml")
+TEXT_TYPES = ("text/plain",)
+PDF_TYPES = ("application/pdf",)
 
-def is_url_valid(url):
-    try:
-        response = requests.get(
-            url,
-            timeout=5,
-            headers={"User-Agent": "Mozilla/5.0"},
-            verify=True
-        )
-        return response.status_code == 200
-    except Exception:
-        return False
 
 def download_and_extract_text(url):
+    """
+    Returns the text of the page, or an empty string if it could not be downloaded or read.
+    """
+    document = download_document(url)
+    return document.page_content if document else ""
+
+
+def download_document(url):
+    # Concurrent downloads of the same URL share one request
+    return group("download").do(url, fetch_document, url)
+
+
+def fetch_body(url):
+    """
+    Streams the response body, up to DOWNLOAD_MAX_BYTES. Returns (content type, body, encoding),
+    or None for error statuses, unsupported types and bodies over the cap.
+    """
+    with span("download"):
+        with requests.get(url, timeout=DOWNLOAD_TIMEOUT, headers=HEADERS, stream=True) as response:
+            if response.status_code != 200:
+                return None
+            content_type, *params = response.headers.get("Content-Type", "text/html").split(";")
+            content_type = content_type.strip().lower()
+            # Only an explicit charset; otherwise BeautifulSoup reads it from the page (requests would assume Latin-1)
+            encoding = next((p.split("=", 1)[1].strip(' "') for p in params if p.strip().lower().startswith("charset=")), None)
+            if content_type not in HTML_TYPES + TEXT_TYPES + PDF_TYPES:
+                return None
+            if int(response.headers.get("Content-Length") or 0) > DOWNLOAD_MAX_BYTES:
+                return None
+
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(CHUNK_SIZE):
+                size += len(chunk)
+                if size > DOWNLOAD_MAX_BYTES:
+                    # A truncated PDF cannot be read; a truncated page still has its start
+                    if content_type in PDF_TYPES:
+                        return None
+                    chunks.append(chunk[:DOWNLOAD_MAX_BYTES - (size - len(chunk))])
+                    break
+                chunks.append(chunk)
+            return content_type, b"".join(chunks), encoding
+
+
+def extract_html(body: bytes, encoding: str = None):
+    soup = BeautifulSoup(body, "html.parser", from_encoding=encoding)
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    # Remove script and style elements
+    for tag in soup(["script", "style", "noscript"]):
+        tag.decompose()
+    text = soup.get_text(separator="\n", strip=True)
+    soup.decompose()
+    # Collapse multiple newlines
+    return "\n".join(line for line in text.splitlines() if line.strip()), title
+
+
+def extract_pdf(body: bytes):
     try:
-        response = requests.get(
-            url,
-            timeout=10,
-            headers={"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
-        )
-        response.raise_for_status()
-        soup = BeautifulSoup(response.text, "html.parser")
-        # Remove script and style elements
-        for tag in soup(["script", "style", "noscript"]):
-            tag.decompose()
-        text = soup.get_text(separator="\n", strip=True)
-        # Optionally, collapse multiple newlines
-        text = "\n".join([line for line in text.splitlines() if line.strip()])
-        return text
+        from pypdf import PdfReader
+    except ImportError:
+        print("Skipping PDF: pypdf is not installed")
+        return "", ""
+    reader = PdfReader(io.BytesIO(body))
+    pages = []
+    size = 0
+    for page in reader.pages:
+        text = page.extract_text() or ""
+        pages.append(text)
+        size += len(text)
+        if size >= DOWNLOAD_MAX_CHARS:
+            break
+    title = (reader.metadata.title if reader.metadata else None) or ""
+    return "\n".join(pages), title
+
+
+def fetch_document(url):
+    """
+    Downloads one URL and returns it as a Document, or None if it is unusable.
+    """
+    try:
+        fetched = fetch_body(url)
+        if fetched is None:
+            return None
+        content_type, body, encoding = fetched
+        if content_type in PDF_TYPES:
+            text, title = extract_pdf(body)
+        elif content_type in TEXT_TYPES:
+            text, title = body.decode(encoding or "utf-8", errors="replace"), ""
+        else:
+            text, title = extract_html(body, encoding)
     except Exception as e:
-        return f"Error downloading {url}: {str(e)}"
-    
-
-
-def load_documents(urls):
-    if not urls:
-        return []
-    valid_urls = [url for url in urls if is_url_valid(url)]
-    if not valid_urls:
-        return []
-    documents = []
-    for url in valid_urls:
-        content = download_and_extract_text(url)
-        # documents.append({"url": url, "content": content})
-        documents.append(content)
-    return documents
+        print(f"Error downloading {url}: {e}")
+        return None
+    text = text[:DOWNLOAD_MAX_CHARS]
+    if not text.strip():
+        return None
+    return Document(page_content=text, metadata={"source": url, "title": title, "content_type": content_type})
+
+
+def iter_documents(urls):
+    """
+    Yields the usable documents for the URLs, downloading each when the caller asks for it.
+    """
+    for url in urls or []:
+        document = download_document(url)
+        if document is not None:
+            yield document
+
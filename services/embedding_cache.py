@@ -0,0 +1,74 @@
+import os
+import hashlib
+import numpy as np
+from typing import List
+from langchain_core.embeddings import Embeddings
+from services.cache import LRUCache, DiskCache, CACHE_DIR
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings object with a two-level cache:
+    1. in-memory LRU, per process
+    2. local SQLite store, shared by workers and kept across restarts
+    Misses are embedded in batches. Queries and documents are cached separately,
+    since the underlying model embeds them with different task types.
+    """
+
+    def __init__(self, embeddings: Embeddings, namespace: str, memory_size: int = None, path: str = None, batch_size: int = 100):
+        self.embeddings = embeddings
+        self.namespace = namespace
+        self.batch_size = batch_size
+        self.memory = LRUCache(maxsize=memory_size or int(os.getenv("EMBEDDING_CACHE_SIZE", 4096)))
+        self.disk = DiskCache(path or os.path.join(CACHE_DIR, "embeddings.sqlite"))
+
+    def _key(self, kind: str, text: str) -> str:
+        text = " ".join(text.split())
+        return hashlib.sha256(f"{self.namespace}:{kind}:{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> dict:
+        found = {}
+        for key in keys:
+            vector = self.memory.get(key)
+            if vector is not None:
+                found[key] = vector
+
+        missing = [key for key in keys if key not in found]
+        if missing:
+            for key, blob in self.disk.get_many(missing).items():
+                vector = np.frombuffer(blob, dtype="float32").tolist()
+                self.memory.set(key, vector)
+                found[key] = vector
+        return found
+
+    def _store(self, vectors: dict):
+        for key, vector in vectors.items():
+            self.memory.set(key, vector)
+        self.disk.set_many({key: np.asarray(vector, dtype="float32").tobytes() for key, vector in vectors.items()})
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key("document", text) for text in texts]
+        found = self._lookup(keys)
+
+        # Embed each distinct miss once, batch by batch, storing as we go
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing[key] = text
+        missing_keys = list(missing)
+        for i in range(0, len(missing_keys), self.batch_size):
+            batch = missing_keys[i:i + self.batch_size]
+            vectors = dict(zip(batch, self.embeddings.embed_documents([missing[key] for key in batch])))
+            self._store(vectors)
+            found.update(vectors)
+
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key("query", text)
+        found = self._lookup([key])
+        if key in found:
+            return found[key]
+        vector = self.embeddings.embed_query(text)
+        self._store({key: vector})
+        return vector
@@ -0,0 +1,459 @@
+"""
+Glossary index storage.
+
+An index directory holds:
+- vectors.npy      float32 embeddings, the source of truth for rebuilds (no re-embedding needed)
+- glossary.faiss   faiss index written with faiss.write_index (no pickle)
+- docstore.jsonl   one {"id", "page_content", "metadata"} object per glossary chunk
+- meta.json        index type, dimension, count and embedding model
+
+Directories written by langchain's FAISS.save_local (index.faiss + index.pkl) are still
+loaded as a fallback and can be converted with:
+    python -m services.glossary_index convert --type ivfpq
+
+Building from glossary sources (.json, .csv, .txt, .md files or directories of them):
+    python -m services.glossary_index build --sources assets/glossary_sources
+    python -m services.glossary_index add --sources new_terms.csv
+    python -m services.glossary_index remove --source assets/glossary_sources/old.json
+Chunks are keyed by a hash of their content, so only new chunks are embedded. Embeddings are
+stored batch by batch in the embedding cache, so an interrupted build resumes where it stopped.
+"""
+import os
+import csv
+import json
+import hashlib
+import time
+import pickle
+import argparse
+import threading
+import numpy as np
+import faiss
+from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from tqdm import tqdm
+from langchain_google_genai.embeddings import GoogleGenerativeAIEmbeddings
+from services.embedding_cache import CachedEmbeddings
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+INDEX_DIR = os.getenv("GLOSSARY_INDEX_DIR", "./assets/glossary_index")
+INDEX_TYPE = os.getenv("GLOSSARY_INDEX_TYPE", "flat")
+EMBEDDING_MODEL = "models/embedding-001"
+INDEX_TYPES = ("flat", "ivf", "pq", "ivfpq")
+
+INDEX_FILE = "glossary.faiss"
+VECTORS_FILE = "vectors.npy"
+DOCSTORE_FILE = "docstore.jsonl"
+META_FILE = "meta.json"
+
+
+def get_embeddings():
+    """
+    Google embeddings behind the local embedding cache, so repeated wording skips the network.
+    """
+    return CachedEmbeddings(GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL), namespace=EMBEDDING_MODEL)
+
+
+def index_factory_string(index_type: str, dim: int, count: int) -> str:
+    """
+    Maps an index type to a faiss factory string sized for the number of vectors.
+    - flat:  exact search
+    - ivf:   inverted lists over ~sqrt(count) centroids, exact vectors
+    - pq:    product-quantised vectors, brute-force scan of the codes
+    - ivfpq: inverted lists + product quantisation, smallest and fastest at scale
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown glossary index type: {index_type}, expected one of {INDEX_TYPES}")
+
+    nlist = max(1, min(int(np.sqrt(count)), count // 39 or 1))
+    # PQ sub-vectors must divide the dimension; k-means on 2^nbits codes wants ~39 training points per code
+    m = next((m for m in (64, 48, 32, 16, 8, 4, 2) if dim % m == 0 and m <= dim // 8), 1)
+    nbits = max(1, min(8, int(np.log2(max(count // 39, 2)))))
+
+    if index_type == "flat":
+        return "IDMap2,Flat"
+    if index_type == "ivf":
+        return f"IVF{nlist},Flat"
+    if index_type == "pq":
+        return f"IDMap2,PQ{m}x{nbits}"
+    return f"IVF{nlist},PQ{m}x{nbits}"
+
+
+def build_index(vectors: np.ndarray, ids: np.ndarray, index_type: str = "flat"):
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    index = faiss.index_factory(vectors.shape[1], index_factory_string(index_type, *vectors.shape[::-1]))
+    if not index.is_trained:
+        index.train(vectors)
+    index.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+    return index
+
+
+def set_nprobe(index, nprobe: int = None):
+    """
+    Sets how many inverted lists an IVF index scans per query (no-op for other types).
+    """
+    nprobe = nprobe or int(os.getenv("GLOSSARY_NPROBE", 8))
+    try:
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    except RuntimeError:
+        pass
+
+
+def save_glossary_index(path: str, vectors: np.ndarray, documents: list, ids, index_type: str = "flat"):
+    """
+    Writes vectors, documents and a freshly built index of the given type to the directory.
+    """
+    os.makedirs(path, exist_ok=True)
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    ids = np.asarray(ids, dtype="int64")
+    index = build_index(vectors, ids, index_type)
+
+    # Write to temporary names first so running workers never see a half-written index
+    np.save(os.path.join(path, VECTORS_FILE + ".tmp.npy"), vectors)
+    faiss.write_index(index, os.path.join(path, INDEX_FILE + ".tmp"))
+    with open(os.path.join(path, DOCSTORE_FILE + ".tmp"), "w", encoding="utf-8") as f:
+        for doc_id, doc in zip(ids.tolist(), documents):
+            f.write(json.dumps({"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata}) + "\n")
+    with open(os.path.join(path, META_FILE + ".tmp"), "w") as f:
+        json.dump({
+            "version": 1,
+            "index_type": index_type,
+            "dim": int(vectors.shape[1]),
+            "count": int(vectors.shape[0]),
+            "embedding_model": EMBEDDING_MODEL,
+        }, f, indent=2)
+
+    os.replace(os.path.join(path, VECTORS_FILE + ".tmp.npy"), os.path.join(path, VECTORS_FILE))
+    os.replace(os.path.join(path, INDEX_FILE + ".tmp"), os.path.join(path, INDEX_FILE))
+    os.replace(os.path.join(path, DOCSTORE_FILE + ".tmp"), os.path.join(path, DOCSTORE_FILE))
+    os.replace(os.path.join(path, META_FILE + ".tmp"), os.path.join(path, META_FILE))
+    return index
+
+
+def read_index(path: str):
+    """
+    Reads the faiss index read-only. IVF inverted lists are memory-mapped, so their pages
+    live in the OS page cache and are shared by every worker process on the host.
+    """
+    index = faiss.read_index(os.path.join(path, INDEX_FILE), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    set_nprobe(index)
+    return index
+
+
+def read_documents(path: str):
+    ids, documents = [], []
+    with open(os.path.join(path, DOCSTORE_FILE), encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            ids.append(row["id"])
+            documents.append(Document(page_content=row["page_content"], metadata=row.get("metadata") or {}))
+    return ids, documents
+
+
+def read_vectors(path: str) -> np.ndarray:
+    return np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+
+
+def read_legacy_index(path: str):
+    """
+    Reads a directory written by langchain's FAISS.save_local and returns (vectors, documents).
+    Only use on trusted files: the docstore is a pickle.
+    """
+    index = faiss.read_index(os.path.join(path, "index.faiss"))
+    with open(os.path.join(path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    vectors = index.reconstruct_n(0, index.ntotal)
+    documents = [docstore.search(index_to_docstore_id[i]) for i in range(index.ntotal)]
+    return vectors, documents
+
+
+def load_glossary_index(path: str = INDEX_DIR, embeddings=None, connect: bool = True):
+    """
+    Returns the glossary as a langchain FAISS vector store.
+    With connect=False no embeddings client is created (see preload_glossary_db).
+    """
+    if connect:
+        embeddings = embeddings or get_embeddings()
+    if not os.path.exists(os.path.join(path, INDEX_FILE)):
+        return FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+
+    index = read_index(path)
+    ids, documents = read_documents(path)
+    docstore = InMemoryDocstore({str(doc_id): doc for doc_id, doc in zip(ids, documents)})
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id={doc_id: str(doc_id) for doc_id in ids},
+    )
+
+
+_glossary_db = None
+_glossary_lock = threading.Lock()
+
+
+def preload_glossary_db():
+    """
+    Loads the index and docstore without any network client, so it can run in a
+    pre-fork master: workers inherit the pages and attach their own embeddings client.
+    """
+    global _glossary_db
+    with _glossary_lock:
+        if _glossary_db is None:
+            _glossary_db = load_glossary_index(connect=False)
+
+
+def reset_glossary_clients():
+    """
+    Drops the embeddings client inherited over fork; the next get_glossary_db() creates a fresh one.
+    """
+    if _glossary_db is not None:
+        _glossary_db.embedding_function = None
+
+
+def get_glossary_db():
+    """
+    Process-wide glossary vector store, loaded once on first use.
+    """
+    global _glossary_db
+    if _glossary_db is None or _glossary_db.embedding_function is None:
+        with _glossary_lock:
+            if _glossary_db is None:
+                _glossary_db = load_glossary_index()
+            elif _glossary_db.embedding_function is None:
+                _glossary_db.embedding_function = get_embeddings()
+    return _glossary_db
+
+
+def chunk_id(document: Document) -> int:
+    """
+    Stable id derived from the chunk content: identical chunks from any source share one id.
+    """
+    digest = hashlib.sha256(document.page_content.strip().encode("utf-8")).hexdigest()
+    return int(digest[:15], 16)
+
+
+def read_meta(path: str) -> dict:
+    meta_path = os.path.join(path, META_FILE)
+    if not os.path.exists(meta_path):
+        return {}
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def load_sources(paths: list) -> list:
+    """
+    Reads glossary sources into documents, one per term (or per text file).
+    - .json: {"term": "definition"} or [{"term": ..., "definition": ...}]
+    - .csv:  "term" and "definition" columns
+    - .txt / .md: the whole file
+    Directories are scanned recursively.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names))
+        else:
+            files.append(path)
+
+    documents = []
+    for file in files:
+        ext = os.path.splitext(file)[1].lower()
+        source = os.path.normpath(file)
+        if ext == ".json":
+            with open(file, encoding="utf-8") as f:
+                data = json.load(f)
+            entries = data.items() if isinstance(data, dict) else [(e.get("term"), e.get("definition")) for e in data]
+        elif ext == ".csv":
+            with open(file, encoding="utf-8", newline="") as f:
+                entries = [(row.get("term"), row.get("definition")) for row in csv.DictReader(f)]
+        elif ext in (".txt", ".md"):
+            with open(file, encoding="utf-8") as f:
+                documents.append(Document(page_content=f.read(), metadata={"source": source}))
+            continue
+        else:
+            continue
+
+        for term, definition in entries:
+            if term and definition:
+                documents.append(Document(page_content=f"{term}: {definition}", metadata={"source": source, "term": term}))
+    return documents
+
+
+def split_documents(documents: list) -> list:
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+    return splitter.split_documents(documents)
+
+
+def embed_in_batches(documents: list, batch_size: int = 100) -> np.ndarray:
+    """
+    Embeds documents batch by batch with a progress bar. Every finished batch is
+    persisted by the embedding cache, so rerunning after a failure skips it.
+    """
+    embeddings = get_embeddings()
+    vectors = []
+    for i in tqdm(range(0, len(documents), batch_size), desc="Embedding glossary", unit="batch"):
+        batch = documents[i:i + batch_size]
+        vectors.extend(embeddings.embed_documents([doc.page_content for doc in batch]))
+    return np.asarray(vectors, dtype="float32")
+
+
+def read_existing(path: str):
+    """
+    Returns (ids, documents, vectors) of the index at path, or empty values if there is none.
+    """
+    if not os.path.exists(os.path.join(path, VECTORS_FILE)):
+        return [], [], None
+    ids, documents = read_documents(path)
+    return ids, documents, read_vectors(path)
+
+
+def write_index(path: str, ids: list, documents: list, vectors_by_id: dict, index_type: str):
+    if not ids:
+        raise ValueError("Refusing to write an empty glossary index")
+    vectors = np.stack([vectors_by_id[doc_id] for doc_id in ids])
+    save_glossary_index(path, vectors, documents, ids, index_type)
+
+
+def update_glossary_index(path: str, sources: list, index_type: str = None, keep_existing: bool = False):
+    """
+    Syncs the index with the given sources, re-embedding only chunks that are not indexed yet.
+    - keep_existing=False: the index ends up with exactly the chunks of the sources (build)
+    - keep_existing=True:  chunks of the sources are added to the current index (add)
+    """
+    index_type = index_type or read_meta(path).get("index_type") or INDEX_TYPE
+    old_ids, old_documents, old_vectors = read_existing(path)
+    vectors_by_id = {doc_id: old_vectors[i] for i, doc_id in enumerate(old_ids)}
+
+    ids, documents = ([], []) if not keep_existing else (list(old_ids), list(old_documents))
+    seen = set(ids)
+    for doc in split_documents(load_sources(sources)):
+        doc_id = chunk_id(doc)
+        if doc_id not in seen:
+            seen.add(doc_id)
+            ids.append(doc_id)
+            documents.append(doc)
+
+    to_embed = [(doc_id, doc) for doc_id, doc in zip(ids, documents) if doc_id not in vectors_by_id]
+    if to_embed:
+        vectors = embed_in_batches([doc for _, doc in to_embed])
+        vectors_by_id.update({doc_id: vector for (doc_id, _), vector in zip(to_embed, vectors)})
+
+    write_index(path, ids, documents, vectors_by_id, index_type)
+    removed = len(set(old_ids) - seen)
+    print(f"Glossary index: {len(ids)} chunks ({len(to_embed)} embedded, {len(ids) - len(to_embed)} reused, {removed} removed)")
+
+
+def remove_from_glossary_index(path: str, sources: list = None, terms: list = None):
+    """
+    Drops chunks by source file or by term, without embedding anything.
+    """
+    sources = {os.path.normpath(source) for source in sources or []}
+    terms = {term.lower() for term in terms or []}
+    old_ids, old_documents, old_vectors = read_existing(path)
+
+    ids, documents, vectors_by_id = [], [], {}
+    for i, (doc_id, doc) in enumerate(zip(old_ids, old_documents)):
+        if doc.metadata.get("source") in sources or str(doc.metadata.get("term", "")).lower() in terms:
+            continue
+        ids.append(doc_id)
+        documents.append(doc)
+        vectors_by_id[doc_id] = old_vectors[i]
+
+    write_index(path, ids, documents, vectors_by_id, read_meta(path).get("index_type") or INDEX_TYPE)
+    print(f"Glossary index: removed {len(old_ids) - len(ids)} chunks, {len(ids)} left")
+
+
+def convert(src: str, dst: str, index_type: str):
+    if os.path.exists(os.path.join(src, VECTORS_FILE)):
+        vectors = read_vectors(src)
+        ids, documents = read_documents(src)
+    else:
+        vectors, documents = read_legacy_index(src)
+        ids = [chunk_id(doc) for doc in documents]
+    save_glossary_index(dst, vectors, documents, ids, index_type)
+    print(f"Wrote {len(documents)} glossary chunks to {dst} as a {index_type} index")
+
+
+def benchmark(path: str, k: int = 4, n_queries: int = 200, seed: int = 0):
+    """
+    Compares every index type against exact search on the stored vectors.
+    Queries are stored vectors with a little noise, so no embedding calls are made.
+    Reports recall@k, search latency, build time and index size.
+    """
+    vectors = np.ascontiguousarray(read_vectors(path), dtype="float32")
+    ids = np.arange(len(vectors), dtype="int64")
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), size=min(n_queries, len(vectors)), replace=False)]
+    queries = (sample + rng.normal(0, 0.01, sample.shape)).astype("float32")
+
+    exact = build_index(vectors, ids, "flat")
+    _, truth = exact.search(queries, k)
+
+    print(f"{'type':<8}{'recall@' + str(k):>10}{'p50 ms':>10}{'p95 ms':>10}{'build s':>10}{'size MB':>10}")
+    for index_type in INDEX_TYPES:
+        start = time.perf_counter()
+        index = build_index(vectors, ids, index_type)
+        build_seconds = time.perf_counter() - start
+        set_nprobe(index)
+
+        latencies, hits = [], 0
+        for i, query in enumerate(queries):
+            start = time.perf_counter()
+            _, found = index.search(query[None, :], k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(set(found[0]) & set(truth[i]))
+
+        size_mb = faiss.serialize_index(index).nbytes / 1e6
+        p50, p95 = np.percentile(latencies, [50, 95])
+        print(f"{index_type:<8}{hits / truth.size:>10.3f}{p50:>10.3f}{p95:>10.3f}{build_seconds:>10.2f}{size_mb:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Glossary index maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = subparsers.add_parser("convert", help="Rebuild the index with another index type")
+    convert_parser.add_argument("--src", default=INDEX_DIR)
+    convert_parser.add_argument("--dst", default=INDEX_DIR)
+    convert_parser.add_argument("--type", default=INDEX_TYPE, choices=INDEX_TYPES)
+
+    build_parser = subparsers.add_parser("build", help="Sync the index with the given glossary sources")
+    build_parser.add_argument("--sources", nargs="+", required=True)
+    build_parser.add_argument("--dir", default=INDEX_DIR)
+    build_parser.add_argument("--type", default=None, choices=INDEX_TYPES)
+
+    add_parser = subparsers.add_parser("add", help="Add glossary sources to the index")
+    add_parser.add_argument("--sources", nargs="+", required=True)
+    add_parser.add_argument("--dir", default=INDEX_DIR)
+
+    remove_parser = subparsers.add_parser("remove", help="Remove chunks by source file or term")
+    remove_parser.add_argument("--source", nargs="*", default=[])
+    remove_parser.add_argument("--term", nargs="*", default=[])
+    remove_parser.add_argument("--dir", default=INDEX_DIR)
+
+    bench_parser = subparsers.add_parser("bench", help="Recall/latency benchmark of all index types")
+    bench_parser.add_argument("--dir", default=INDEX_DIR)
+    bench_parser.add_argument("--k", type=int, default=4)
+    bench_parser.add_argument("--queries", type=int, default=200)
+
+    args = parser.parse_args()
+    if args.command == "convert":
+        convert(args.src, args.dst, args.type)
+    elif args.command == "build":
+        update_glossary_index(args.dir, args.sources, args.type)
+    elif args.command == "add":
+        update_glossary_index(args.dir, args.sources, keep_existing=True)
+    elif args.command == "remove":
+        remove_from_glossary_index(args.dir, args.source, args.term)
+    elif args.command == "bench":
+        benchmark(args.dir, args.k, args.queries)
+
+
+if __name__ == "__main__":
+    main()
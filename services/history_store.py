@@ -0,0 +1,36 @@
+"""
+Chat histories by conversation id, stored compactly (services.storage.pack_history, msgpack + zstd)
+in a SQLite file under CACHE_DIR shared by all workers. Histories expire after HISTORY_TTL seconds.
+"""
+import os
+from services.cache import CACHE_DIR, DiskCache
+from services.storage import encode, decode, pack_history, unpack_history
+
+HISTORY_TTL = float(os.getenv("HISTORY_TTL", 30 * 24 * 60 * 60))
+HISTORY_DB = os.path.join(CACHE_DIR, "histories.sqlite")
+
+
+class HistoryStore:
+
+    def __init__(self, path: str = HISTORY_DB, ttl: float = HISTORY_TTL):
+        self.cache = DiskCache(path, ttl=ttl)
+
+    def get(self, conversation_id: str) -> list:
+        value = self.cache.get(f"history:{conversation_id}")
+        return unpack_history(decode(value, "history")) if value else []
+
+    def put(self, conversation_id: str, history: list):
+        self.cache.set(f"history:{conversation_id}", encode(pack_history(history), "history"))
+
+    def delete(self, conversation_id: str):
+        self.cache.delete(f"history:{conversation_id}")
+
+
+_store = None
+
+
+def get_history_store() -> HistoryStore:
+    global _store
+    if _store is None:
+        _store = HistoryStore()
+    return _store
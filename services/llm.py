@@ -1,6 +1,10 @@
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
+from services.metrics import span, record_tokens
+from services.schemas import parse_structured
+from services.streaming import current_sink
+from services.rate_limit import limiter
 import os
 
 load_dotenv()
@@ -10,27 +14,17 @@ class LLM:
         self.api_key=os.getenv("GEMINI_API_KEY")
         self.system_message = system_message
 
-    def send_message_with_history(self, history: list, message: str, save_history=False) -> str:
+    def send_message_with_history(self, history: list, message: str, save_history=False, stream=False) -> str:
+        """
+        Returns the model's reply. With stream=True and a token sink active (services.streaming),
+        the reply is also written to the sink as it is generated.
+        """
         try:
-            contents = []
-
-            # Add previous history
-            for entry in history:
-                contents.append(entry["parts"][0]["text"])
-
-            # Append new user message
-            contents.append(message)
-
-            response = genai.Client(api_key= self.api_key).models.generate_content(
-                model="gemini-2.5-flash",
-                contents=contents,
-                config=types.GenerateContentConfig(
-                    system_instruction=self.system_message,
-                    # Can add: max_output_tokens, temperature, top_p, etc.
-                )
-            )
-
-            text = response.text
+            sink = current_sink() if stream else None
+            if sink is not None:
+                text = self.generate_to_sink(history, message, sink)
+            else:
+                text = self.generate(history, message).text
 
             if save_history:
                 self.append_to_history(history, "user", message)
@@ -42,5 +36,75 @@ class LLM:
             print(f"Error while sending message: {e}")
             return ""
 
+    def send_structured_message_with_history(self, history: list, message: str, schema):
+        """
+        Asks for a JSON response constrained to the given pydantic schema.
+        Returns an instance of the schema, or None if the call fails or the response does not match.
+        """
+        try:
+            response = self.generate(history, message, response_mime_type="application/json", response_schema=schema)
+            return parse_structured(schema, response.parsed, response.text)
+
+        except Exception as e:
+            print(f"Error while sending message: {e}")
+            return None
+
+    def generate(self, history: list, message: str, **config):
+        with span("llm", model="gemini-2.5-flash"):
+            response = limiter("gemini").call(
+                genai.Client(api_key= self.api_key).models.generate_content,
+                model="gemini-2.5-flash",
+                contents=self.build_contents(history, message),
+                config=self.build_config(**config)
+            )
+        self.record_usage(response.usage_metadata)
+        return response
+
+    def generate_to_sink(self, history: list, message: str, sink, **config) -> str:
+        """
+        Streams the reply into the sink chunk by chunk and returns the full text.
+        """
+        writer = sink.writer()
+        parts = []
+        usage = None
+        # Streams are not retried, since part of the reply may already have been sent
+        limiter("gemini").acquire()
+        with span("llm", model="gemini-2.5-flash"):
+            for chunk in genai.Client(api_key= self.api_key).models.generate_content_stream(
+                model="gemini-2.5-flash",
+                contents=self.build_contents(history, message),
+                config=self.build_config(**config)
+            ):
+                if chunk.text:
+                    writer.write(chunk.text)
+                    parts.append(chunk.text)
+                # Usage is reported on the last chunks
+                usage = chunk.usage_metadata or usage
+        writer.finish()
+        self.record_usage(usage)
+        return "".join(parts)
+
+    def build_contents(self, history: list, message: str) -> list:
+        contents = []
+
+        # Add previous history
+        for entry in history:
+            contents.append(entry["parts"][0]["text"])
+
+        # Append new user message
+        contents.append(message)
+        return contents
+
+    def build_config(self, **config):
+        return types.GenerateContentConfig(
+            system_instruction=self.system_message,
+            # Can add: max_output_tokens, temperature, top_p, etc.
+            **config
+        )
+
+    def record_usage(self, usage):
+        if usage:
+            record_tokens("gemini-2.5-flash", usage.prompt_token_count or 0, usage.candidates_token_count or 0)
+
     def append_to_history(self, history: list, role: str, text: str):
         history.append({"role": role, "parts": [{"text": text}]})
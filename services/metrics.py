@@ -0,0 +1,138 @@
+"""
+Per-stage latency metrics, exported in the Prometheus text format on /metrics.
+
+- span("stage", **labels) times a block of code (intent parse, contextualisation, search, download, ...)
+- every langchain LLM call, tool call and agent step is recorded by
+  services.callbacks.MetricsCallbackHandler, once install_callbacks() has been called
+- set METRICS_LOG=1 to also print one JSON line per span
+
+Metrics are kept per process: with several gunicorn workers, each scrape reports the worker that answered.
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+
+METRICS_LOG = os.getenv("METRICS_LOG", "").lower() in ("1", "true", "yes")
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+STAGE_SECONDS = "insightz_stage_duration_seconds"
+STAGE_TOTAL = "insightz_stage_total"
+LLM_TOKENS = "insightz_llm_tokens_total"
+AGENT_STEPS = "insightz_agent_steps_total"
+SPECULATION = "insightz_speculation_total"
+RATE_LIMITED = "insightz_rate_limited_total"
+SINGLEFLIGHT_SHARED = "insightz_singleflight_shared_total"
+ARTICLE_SUMMARIES = "insightz_article_summaries_total"
+SEMANTIC_CACHE_LOOKUPS = "insightz_semantic_cache_total"
+NEAR_DUPLICATES = "insightz_near_duplicates_total"
+
+HELP = {
+    STAGE_SECONDS: "Duration of a request pipeline stage",
+    STAGE_TOTAL: "Number of pipeline stage executions by status",
+    LLM_TOKENS: "LLM tokens used, by model and kind (prompt/completion)",
+    AGENT_STEPS: "Search agent tool steps",
+    SPECULATION: "Speculatively started handler steps, by task and outcome (hit/miss/error)",
+    RATE_LIMITED: "Upstream calls answered with a rate-limit error, by provider",
+    SINGLEFLIGHT_SHARED: "Calls that shared the result of an identical in-flight call, by group",
+    ARTICLE_SUMMARIES: "News article summaries needed, by outcome (hit: reused from the store, miss: summarised)",
+    SEMANTIC_CACHE_LOOKUPS: "Semantic answer cache lookups, by action and outcome (hit/miss)",
+    NEAR_DUPLICATES: "Downloaded documents dropped as near-duplicates of another, by source (news/report)",
+}
+
+
+class Registry:
+    """
+    Thread-safe counters and histograms keyed by metric name and label set.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            buckets, total, count = self.histograms.get(key, ([0] * len(BUCKETS), 0.0, 0))
+            buckets = [n + (value <= bound) for n, bound in zip(buckets, BUCKETS)]
+            self.histograms[key] = (buckets, total + value, count + 1)
+
+    def render(self) -> str:
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = dict(self.histograms)
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} counter"]
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+
+        for name in sorted({name for name, _ in histograms}):
+            lines += [f"# HELP {name} {HELP.get(name, name)}", f"# TYPE {name} histogram"]
+            for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, n in zip(BUCKETS, buckets):
+                    le = "+Inf" if bound == float("inf") else str(bound)
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {n}")
+                lines.append(f"{name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+registry = Registry()
+
+
+def log_event(event: dict):
+    if METRICS_LOG:
+        print(json.dumps(event, default=str), flush=True)
+
+
+def record_stage(stage: str, seconds: float, status: str = "ok", **labels):
+    registry.observe(STAGE_SECONDS, seconds, stage=stage, **labels)
+    registry.inc(STAGE_TOTAL, stage=stage, status=status, **labels)
+    log_event({"event": "span", "stage": stage, "status": status, "seconds": round(seconds, 4), **labels})
+
+
+def record_tokens(model: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+    if prompt_tokens:
+        registry.inc(LLM_TOKENS, prompt_tokens, model=model, kind="prompt")
+    if completion_tokens:
+        registry.inc(LLM_TOKENS, completion_tokens, model=model, kind="completion")
+
+
+@contextmanager
+def span(stage: str, **labels):
+    """
+    Times the enclosed block as one execution of the given stage.
+    """
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        record_stage(stage, time.perf_counter() - start, status, **labels)
+
+
+def render() -> str:
+    return registry.render()
@@ -0,0 +1,241 @@
+"""
+Precomputed news digests for a watchlist of popular tickers.
+
+A background refresher rebuilds each watchlisted company's digest every NEWS_DIGEST_INTERVAL seconds,
+incrementally: only articles not already in the digest are downloaded and summarised, their
+summaries are merged with the ones kept from earlier runs (up to NEWS_DIGEST_MAX_ARTICLES, none
+older than NEWS_DIGEST_MAX_AGE), and one merge call produces the new digest text.
+NewsSummary.handle_news_summary answers requests for those companies straight from the store.
+
+Digests live in a SQLite file under CACHE_DIR, shared by all workers; a lease makes sure only
+one worker refreshes per interval.
+
+    NEWS_WATCHLIST="AAPL:Apple,TSLA:Tesla,INFY:Infosys"
+    python -m services.news_digest refresh           # one pass, e.g. from cron
+    python -m services.news_digest refresh --loop    # keep refreshing
+    python -m services.news_digest show AAPL
+"""
+import os
+import re
+import json
+import time
+import argparse
+import threading
+from services.cache import CACHE_DIR, DiskCache
+from services.storage import encode, decode
+
+NEWS_WATCHLIST = os.getenv("NEWS_WATCHLIST", "")
+NEWS_DIGEST_INTERVAL = float(os.getenv("NEWS_DIGEST_INTERVAL", 15 * 60))
+# Digests older than this are not served, so a stopped refresher cannot serve stale news for long
+NEWS_DIGEST_MAX_STALENESS = float(os.getenv("NEWS_DIGEST_MAX_STALENESS", 2 * NEWS_DIGEST_INTERVAL))
+NEWS_DIGEST_MAX_AGE = float(os.getenv("NEWS_DIGEST_MAX_AGE", 2 * 24 * 60 * 60))
+NEWS_DIGEST_MAX_ARTICLES = int(os.getenv("NEWS_DIGEST_MAX_ARTICLES", 20))
+NEWS_DIGEST_DB = os.path.join(CACHE_DIR, "news_digests.sqlite")
+
+COMPANY_SUFFIXES = re.compile(r"\b(inc|incorporated|corp|corporation|co|company|ltd|limited|plc|holdings|group)\b\.?", re.IGNORECASE)
+
+
+class WatchlistEntry:
+
+    def __init__(self, ticker: str, company: str = None):
+        self.ticker = ticker.upper()
+        self.company = company or self.ticker
+
+    @property
+    def query(self) -> str:
+        return f"{self.company} ({self.ticker}) stock latest news"
+
+    def matches(self, name: str) -> bool:
+        name = normalise_company(name)
+        return bool(name) and name in (self.ticker.lower(), normalise_company(self.company))
+
+
+def normalise_company(name: str) -> str:
+    """
+    Lower-cases a company name and drops legal suffixes, e.g. "Apple Inc." -> "apple".
+    """
+    name = COMPANY_SUFFIXES.sub("", (name or "").lower())
+    return re.sub(r"[^a-z0-9&]+", " ", name).strip()
+
+
+def parse_watchlist(value: str) -> list:
+    """
+    Parses "AAPL:Apple,TSLA:Tesla,MSFT" into watchlist entries.
+    """
+    entries = []
+    for item in value.split(","):
+        ticker, _, company = item.strip().partition(":")
+        if ticker.strip():
+            entries.append(WatchlistEntry(ticker.strip(), company.strip() or None))
+    return entries
+
+
+watchlist = parse_watchlist(NEWS_WATCHLIST)
+
+
+class NewsDigestStore:
+    """
+    Digests by ticker: {"ticker", "company", "summary", "articles": [{"url", "title", "summary", "fetched_at"}], "updated_at"}.
+    """
+
+    def __init__(self, path: str = NEWS_DIGEST_DB):
+        self.cache = DiskCache(path)
+
+    def get(self, ticker: str):
+        value = self.cache.get(f"digest:{ticker.upper()}")
+        return decode(value, "document") if value else None
+
+    def put(self, digest: dict):
+        self.cache.set(f"digest:{digest['ticker']}", encode(digest, "document"))
+
+    def lease(self, name: str, seconds: float) -> bool:
+        """
+        Takes a named lease for the given time; False if another process holds it.
+        """
+        return self.cache.add(f"lease:{name}", str(os.getpid()).encode(), ttl=seconds)
+
+
+_store = None
+
+
+def get_store() -> NewsDigestStore:
+    global _store
+    if _store is None:
+        _store = NewsDigestStore()
+    return _store
+
+
+def find_digest(company: str):
+    """
+    Returns the fresh digest for a watchlisted company or ticker, or None.
+    """
+    if not company or not watchlist:
+        return None
+    entry = next((entry for entry in watchlist if entry.matches(company)), None)
+    if entry is None:
+        return None
+    try:
+        digest = get_store().get(entry.ticker)
+    except Exception as e:
+        print(f"News digest lookup failed: {e}")
+        return None
+    if digest and digest.get("summary") and time.time() - digest["updated_at"] <= NEWS_DIGEST_MAX_STALENESS:
+        return digest
+    return None
+
+
+def refresh_digest(news, entry: WatchlistEntry, store: NewsDigestStore) -> dict:
+    """
+    Brings one digest up to date, fetching and summarising only articles it does not have yet.
+    """
+    now = time.time()
+    digest = store.get(entry.ticker) or {"ticker": entry.ticker, "company": entry.company, "summary": "", "articles": [], "updated_at": 0}
+    articles = [a for a in digest["articles"] if now - a["fetched_at"] <= NEWS_DIGEST_MAX_AGE]
+    known = {a["url"] for a in articles}
+
+    urls = [url for url in news.search_with_agent(entry.query) if url and url not in known]
+    docs = news.load_documents(urls)
+    # Articles that could not be summarised come back empty and are retried on the next pass
+    new_articles = [
+        {
+            "url": doc.metadata.get("source", ""),
+            "title": doc.metadata.get("title", ""),
+            "summary": summary,
+            "fetched_at": now,
+        }
+        for doc, summary in zip(docs, news.summarise_articles(docs)) if summary
+    ]
+
+    # Newest first, bounded
+    articles = (new_articles + articles)[:NEWS_DIGEST_MAX_ARTICLES]
+    if new_articles or len(articles) != len(digest["articles"]):
+        digest["summary"] = news.merge_summaries([a["summary"] for a in articles], entry.query) if articles else ""
+    digest.update(articles=articles, company=entry.company, updated_at=now)
+    store.put(digest)
+    print(f"[DIGEST] {entry.ticker}: {len(new_articles)} new, {len(articles)} kept")
+    return digest
+
+
+def refresh_watchlist(news, store: NewsDigestStore = None, entries: list = None, force: bool = False):
+    """
+    Refreshes every watchlisted digest, unless another process already did within this interval.
+    """
+    store = store or get_store()
+    entries = watchlist if entries is None else entries
+    # The lease is not released: it expires shortly before the next pass is due, so with several
+    # workers running a refresher, one of them refreshes per interval
+    if not store.lease("refresh", NEWS_DIGEST_INTERVAL * 0.9) and not force:
+        return False
+    for entry in entries:
+        try:
+            refresh_digest(news, entry, store)
+        except Exception as e:
+            print(f"[DIGEST] Refresh failed for {entry.ticker}: {e}")
+    return True
+
+
+class NewsDigestRefresher:
+    """
+    Daemon thread that refreshes the watchlist every NEWS_DIGEST_INTERVAL seconds.
+    """
+
+    def __init__(self, news, interval: float = NEWS_DIGEST_INTERVAL):
+        self.news = news
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.run, name="news-digest", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        while not self._stop.is_set():
+            refresh_watchlist(self.news)
+            self._stop.wait(self.interval)
+
+
+_refresher = None
+
+
+def start_news_refresher(news):
+    """
+    Starts the refresher once per process; does nothing without a watchlist.
+    """
+    global _refresher
+    if watchlist and _refresher is None:
+        _refresher = NewsDigestRefresher(news).start()
+    return _refresher
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watchlist news digests")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    refresh = subparsers.add_parser("refresh", help="Refresh every watchlisted digest")
+    refresh.add_argument("--loop", action="store_true", help=f"Keep refreshing every {NEWS_DIGEST_INTERVAL:.0f}s")
+    refresh.add_argument("--force", action="store_true", help="Refresh even if another process did within the interval")
+    show = subparsers.add_parser("show", help="Print a stored digest")
+    show.add_argument("ticker")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        print(json.dumps(get_store().get(args.ticker), indent=2))
+        return
+
+    if not watchlist:
+        parser.error("NEWS_WATCHLIST is empty")
+    from controllers.news_summariser import NewsSummary
+    news = NewsSummary(verbose=True)
+    while True:
+        if not refresh_watchlist(news, force=args.force):
+            print("Digests were refreshed by another process within the interval")
+        if not args.loop:
+            break
+        time.sleep(NEWS_DIGEST_INTERVAL)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+"""
+Shared rate limiting for upstream providers (Gemini, Tavily, DuckDuckGo, Yahoo search, yfinance).
+
+Each provider gets one ProviderLimiter per process (see limiter(name)), combining:
+- a token bucket: at most `rate` calls per second, with bursts up to `burst`
+- AIMD adaptive concurrency: the number of calls in flight grows by ~1 per limit's worth of
+  successful calls and halves when the provider answers 429 / rate-limited
+- retries of rate-limited calls with exponential backoff and full jitter; a rate-limited call
+  also pauses the bucket, so other callers back off too instead of piling on
+
+With RATE_LIMIT_SHARED=1 the token buckets (and pauses) live in a SQLite file under CACHE_DIR,
+so all gunicorn workers on the host share one budget per provider. Concurrency stays per process.
+
+Per-provider settings, e.g. for Tavily: TAVILY_RATE_LIMIT (calls/s), TAVILY_BURST, TAVILY_MAX_CONCURRENCY.
+"""
+import os
+import re
+import time
+import random
+import sqlite3
+import threading
+from contextlib import contextmanager
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.rate_limiters import BaseRateLimiter
+from services.cache import CACHE_DIR
+from services.metrics import registry, RATE_LIMITED
+
+# provider: (calls per second, burst, max concurrency)
+PROVIDERS = {
+    "gemini": (10, 20, 16),
+    "tavily": (5, 10, 8),
+    "duckduckgo": (1, 3, 2),
+    "yahoo_search": (2, 5, 4),
+    "yfinance": (2, 5, 4),
+}
+
+RATE_LIMIT_SHARED = os.getenv("RATE_LIMIT_SHARED", "").lower() in ("1", "true", "yes")
+RATE_LIMIT_DB = os.path.join(CACHE_DIR, "rate_limits.sqlite")
+RATE_LIMIT_RETRIES = int(os.getenv("RATE_LIMIT_RETRIES", 3))
+BACKOFF_BASE = float(os.getenv("RATE_LIMIT_BACKOFF_BASE", 1.0))
+BACKOFF_MAX = float(os.getenv("RATE_LIMIT_BACKOFF_MAX", 30.0))
+
+# An exception a tool caught and returned as its repr, e.g. HTTPError('429 Client Error: Too Many Requests ...')
+ERROR_REPR = re.compile(r"^\s*[A-Za-z_][\w.]*(Error|Exception|Exhausted)\(")
+RATE_LIMIT_STATUS = re.compile(r"\b429\b|too many requests|resource[_ ]exhausted", re.IGNORECASE)
+RATE_LIMIT_MARKERS = ("429", "too many requests", "rate limit", "ratelimit", "resource_exhausted", "resource exhausted", "quota")
+
+
+class RateLimitError(Exception):
+    """
+    Raised for a provider answer that means "slow down", when the client did not raise one itself.
+    """
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    if isinstance(error, RateLimitError):
+        return True
+    if getattr(getattr(error, "response", None), "status_code", None) == 429 or getattr(error, "code", None) == 429:
+        return True
+    return is_rate_limit_message(f"{type(error).__name__}: {error}")
+
+
+def is_rate_limit_message(text: str) -> bool:
+    text = text.lower()
+    return any(marker in text for marker in RATE_LIMIT_MARKERS)
+
+
+def raise_for_rate_limit(result):
+    """
+    Some tools (e.g. Tavily) catch their own errors and return them instead of raising:
+    the exception itself, an error payload, or its repr as text. Turns a rate-limited one back into
+    an exception so the limiter can react to it. Ordinary results are returned as-is, even when
+    their text mentions "429" or "quota".
+    """
+    if isinstance(result, Exception) and is_rate_limit_error(result):
+        raise RateLimitError(str(result)) from result
+    if isinstance(result, dict):
+        error = result.get("error") if isinstance(result.get("error"), dict) else result
+        if 429 in (error.get("status_code"), error.get("status"), error.get("code")):
+            raise RateLimitError(str(result))
+    if isinstance(result, str) and ERROR_REPR.match(result) and RATE_LIMIT_STATUS.search(result):
+        raise RateLimitError(result)
+    return result
+
+
+def backoff(attempt: int) -> float:
+    """
+    Exponential backoff with full jitter: uniform in [0, min(max, base * 2^attempt)].
+    """
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class TokenBucket:
+    """
+    In-process token bucket. try_acquire() takes a token and returns 0, or returns how long to wait.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.paused_until > now:
+                return self.paused_until - now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class SharedTokenBucket:
+    """
+    Token bucket stored in SQLite, shared by every process on the host that uses the same file.
+    """
+
+    def __init__(self, path: str, name: str, rate: float, burst: float):
+        self.path = path
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self._local = threading.local()
+        # SQLite connections must not be shared with a forked child
+        os.register_at_fork(after_in_child=self._forget_connections)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL, paused_until REAL)")
+        conn.execute("INSERT OR IGNORE INTO buckets VALUES (?, ?, ?, 0)", (name, burst, time.time()))
+
+    def _forget_connections(self):
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; transactions are opened explicitly with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def try_acquire(self) -> float:
+        with self._transaction() as conn:
+            tokens, updated, paused_until = conn.execute(
+                "SELECT tokens, updated, paused_until FROM buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            now = time.time()
+            tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+            wait = 0.0
+            if paused_until > now:
+                wait = paused_until - now
+            elif tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            conn.execute("UPDATE buckets SET tokens = ?, updated = ? WHERE name = ?", (tokens, now, self.name))
+        return wait
+
+    def pause(self, seconds: float):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE buckets SET paused_until = MAX(paused_until, ?) WHERE name = ?", (time.time() + seconds, self.name)
+            )
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on calls in flight: +1/limit per success, halved on a rate-limited call
+    (at most once per second, so one burst of 429s counts as one signal).
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self):
+        with self._cond:
+            while self.in_flight >= max(self.min_limit, int(self.limit)):
+                self._cond.wait()
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+                self._cond.notify()
+
+    def on_success(self):
+        with self._cond:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify()
+
+    def on_throttled(self):
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_decrease >= 1.0:
+                self.limit = max(self.min_limit, self.limit / 2)
+                self._last_decrease = now
+
+
+class ProviderLimiter:
+    """
+    Token bucket + adaptive concurrency + jittered retries for one provider.
+    """
+
+    def __init__(self, name: str, rate: float, burst: float, max_concurrency: int, retries: int = RATE_LIMIT_RETRIES, shared: bool = RATE_LIMIT_SHARED):
+        self.name = name
+        self.retries = retries
+        self.bucket = SharedTokenBucket(RATE_LIMIT_DB, name, rate, burst) if shared else TokenBucket(rate, burst)
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Takes one token from the bucket, waiting for it unless blocking is False.
+        """
+        while True:
+            wait = self.bucket.try_acquire()
+            if not wait:
+                return True
+            if not blocking:
+                return False
+            time.sleep(min(wait, 1.0))
+
+    def throttled(self, attempt: int = 0):
+        """
+        Records a rate-limited answer: halves the concurrency and pauses the bucket for everyone.
+        Returns the backoff to wait before retrying.
+        """
+        registry.inc(RATE_LIMITED, provider=self.name)
+        self.concurrency.on_throttled()
+        delay = backoff(attempt)
+        self.bucket.pause(delay)
+        return delay
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Calls fn under the limits, retrying rate-limited calls with backoff. Other errors are raised as-is.
+        """
+        for attempt in range(self.retries + 1):
+            self.acquire()
+            with self.concurrency.slot():
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    if not is_rate_limit_error(e):
+                        raise
+                    # Recorded on the last attempt too, so the limits react even when the call gives up
+                    delay = self.throttled(attempt)
+                    if attempt == self.retries:
+                        raise
+                else:
+                    self.concurrency.on_success()
+                    return result
+            print(f"[RATE LIMIT] {self.name} rate-limited, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def run_tool(self, tool, query: str):
+        """
+        Runs a langchain tool under the limits, treating rate-limit messages it returns as errors.
+        """
+        return self.call(lambda: raise_for_rate_limit(tool.run(query)))
+
+
+class LangchainRateLimiter(BaseRateLimiter):
+    """
+    Adapter for langchain chat models (rate_limiter=...): only the token bucket applies before a call.
+    The models retry 429s themselves; the outcome of each call is fed back to the provider's
+    limits by RateLimitCallbackHandler.
+    """
+
+    def __init__(self, provider: ProviderLimiter):
+        self.provider = provider
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        return self.provider.acquire(blocking)
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        return self.provider.acquire(blocking)
+
+
+# langchain ls_provider of a chat model -> limiter name
+LANGCHAIN_PROVIDERS = {
+    "google_genai": "gemini",
+}
+
+
+class RateLimitCallbackHandler(BaseCallbackHandler):
+    """
+    Feeds the outcome of langchain chat model calls back to the provider's limits: a rate-limited
+    error halves its concurrency and pauses its bucket, like a 429 on a direct call, and a success
+    lets the concurrency grow back.
+    """
+
+    def __init__(self):
+        self._runs = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        provider = LANGCHAIN_PROVIDERS.get((metadata or {}).get("ls_provider"))
+        if provider:
+            self._runs[run_id] = provider
+
+    on_llm_start = on_chat_model_start
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        provider = self._runs.pop(run_id, None)
+        if provider:
+            limiter(provider).concurrency.on_success()
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        provider = self._runs.pop(run_id, None)
+        if provider and is_rate_limit_error(error):
+            limiter(provider).throttled()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter(name: str) -> ProviderLimiter:
+    """
+    Returns the process-wide limiter for the provider, configured from PROVIDERS and the environment.
+    """
+    with _limiters_lock:
+        if name not in _limiters:
+            rate, burst, concurrency = PROVIDERS[name]
+            prefix = name.upper()
+            _limiters[name] = ProviderLimiter(
+                name,
+                rate=float(os.getenv(f"{prefix}_RATE_LIMIT", rate)),
+                burst=float(os.getenv(f"{prefix}_BURST", burst)),
+                max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", concurrency)),
+            )
+        return _limiters[name]
+
+
+def chat_rate_limiter(name: str = "gemini") -> LangchainRateLimiter:
+    return LangchainRateLimiter(limiter(name))
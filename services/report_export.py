@@ -0,0 +1,294 @@
+"""
+Report export to HTML and PDF files, served by routes/download.py.
+
+Exports are rendered off the request path, in a small pool of worker processes (EXPORT_WORKERS),
+so layout work never holds an HTTP worker or its GIL. A file is named after the report's content
+hash and the renderer version, <report id>-v<EXPORT_VERSION>.<format>, so it is rendered once per
+report and format, and its name can be cached forever by clients.
+
+Export state lives next to the file in REPORTS_DIR, so all web workers share it: <file>.pending is
+created exclusively by the worker that renders it (others join that render), and <file>.error holds
+the error of a failed render until the export is requested again.
+
+PDF rendering needs reportlab; without it only HTML exports are available.
+"""
+import os
+import re
+import io
+import time
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from xml.sax.saxutils import escape
+from jinja2 import Environment
+from services.report_store import REPORTS_DIR
+
+EXPORT_FORMATS = ("html", "pdf")
+EXPORT_VERSION = 1
+# Render processes per web worker, started by the first export it renders
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", 1))
+# A render still pending after this many seconds is taken to have died, and is started again
+EXPORT_TIMEOUT = float(os.getenv("EXPORT_TIMEOUT", 300))
+
+# Known report sections, in reading order; any other field is rendered after them
+SECTION_TITLES = [
+    ("summary", "Summary"),
+    ("keyMetrics", "Key metrics"),
+    ("businessOverview", "Business overview"),
+    ("financialPerformance", "Financial performance"),
+    ("valuation", "Valuation"),
+    ("riskFactors", "Risk factors"),
+    ("boardInfo", "Board and governance"),
+    ("competitiveLandscape", "Competitive landscape"),
+    ("strategicOutlook", "Strategic outlook"),
+]
+HEADER_FIELDS = ("id", "company", "generatedAt")
+
+
+def label(key) -> str:
+    """
+    "riskFactors" -> "Risk factors", "high52w" -> "High52w".
+    """
+    return re.sub(r"(?<=[a-z])(?=[A-Z])", " ", str(key)).capitalize()
+
+
+def report_sections(report: dict) -> list:
+    """
+    Returns [(title, value)] for the report body: known sections first, then any other fields.
+    """
+    known = dict(SECTION_TITLES)
+    sections = [(title, report[key]) for key, title in SECTION_TITLES if key in report]
+    sections += [(label(key), value) for key, value in report.items() if key not in known and key not in HEADER_FIELDS]
+    return sections
+
+
+HTML_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{{ report.company or "Company" }} report</title>
+<style>
+body { font-family: Helvetica, Arial, sans-serif; max-width: 52rem; margin: 2rem auto; padding: 0 1rem; color: #1a1a1a; line-height: 1.5; }
+h1 { margin-bottom: 0; }
+.generated { color: #666; margin-top: .25rem; }
+h2 { border-bottom: 1px solid #ddd; padding-bottom: .25rem; margin-top: 2rem; }
+dt { font-weight: bold; margin-top: .5rem; }
+dd { margin-left: 1rem; }
+p { margin: .25rem 0; white-space: pre-line; }
+</style>
+</head>
+<body>
+{%- macro render(value) -%}
+{%- if value is mapping -%}
+<dl>{% for key, item in value.items() %}<dt>{{ key | label }}</dt><dd>{{ render(item) }}</dd>{% endfor %}</dl>
+{%- elif value is iterable and value is not string -%}
+<ul>{% for item in value %}<li>{{ render(item) }}</li>{% endfor %}</ul>
+{%- else -%}
+<p>{{ value if value is not none else "N/A" }}</p>
+{%- endif -%}
+{%- endmacro %}
+<h1>{{ report.company or "Company" }}</h1>
+<p class="generated">Generated {{ report.generatedAt or "" }}</p>
+{% for title, value in sections %}
+<h2>{{ title }}</h2>
+{{ render(value) }}
+{% endfor %}
+</body>
+</html>
+"""
+
+_environment = Environment(autoescape=True)
+_environment.filters["label"] = label
+_html_template = _environment.from_string(HTML_TEMPLATE)
+
+
+def render_html(report: dict) -> bytes:
+    return _html_template.render(report=report, sections=report_sections(report)).encode("utf-8")
+
+
+def pdf_flowables(value, styles) -> list:
+    from reportlab.platypus import Paragraph, ListFlowable, ListItem
+
+    if isinstance(value, dict):
+        flowables = []
+        for key, item in value.items():
+            flowables.append(Paragraph(f"<b>{escape(label(key))}</b>", styles["BodyText"]))
+            flowables += pdf_flowables(item, styles)
+        return flowables
+    if isinstance(value, (list, tuple)):
+        items = [ListItem(pdf_flowables(item, styles)) for item in value]
+        return [ListFlowable(items, bulletType="bullet", leftIndent=12)] if items else []
+    text = "N/A" if value is None else str(value)
+    return [Paragraph(escape(text).replace("\n", "<br/>"), styles["BodyText"])]
+
+
+def render_pdf(report: dict) -> bytes:
+    try:
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+    except ImportError:
+        raise RuntimeError("PDF export needs reportlab, which is not installed")
+
+    styles = getSampleStyleSheet()
+    company = report.get("company") or "Company"
+    story = [
+        Paragraph(escape(company), styles["Title"]),
+        Paragraph(escape(f"Generated {report.get('generatedAt') or ''}"), styles["Italic"]),
+    ]
+    for title, value in report_sections(report):
+        story += [Spacer(1, 12), Paragraph(escape(title), styles["Heading2"])]
+        story += pdf_flowables(value, styles)
+
+    buffer = io.BytesIO()
+    SimpleDocTemplate(buffer, pagesize=A4, title=f"{company} report").build(story)
+    return buffer.getvalue()
+
+
+RENDERERS = {
+    "html": render_html,
+    "pdf": render_pdf,
+}
+
+
+def export_filename(report_id: str, fmt: str) -> str:
+    return f"{report_id}-v{EXPORT_VERSION}.{fmt}"
+
+
+def export_path(report_id: str, fmt: str) -> str:
+    return os.path.join(REPORTS_DIR, export_filename(report_id, fmt))
+
+
+def write_marker(path: str, text: str = ""):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def remove_marker(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def render_export(report: dict, fmt: str, path: str) -> str:
+    """
+    Renders the report to path, atomically. Runs in an export worker process; a failure is
+    recorded in the error marker, and the pending marker is removed either way.
+    """
+    try:
+        content = RENDERERS[fmt](report)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        return path
+    except Exception as e:
+        write_marker(f"{path}.error", str(e) or type(e).__name__)
+        raise
+    finally:
+        remove_marker(f"{path}.pending")
+
+
+def record_failure(path: str, future):
+    """
+    Done callback: records failures the worker process could not, e.g. when it was killed.
+    """
+    if future.cancelled():
+        remove_marker(f"{path}.pending")
+        return
+    error = future.exception()
+    if error is not None and not os.path.exists(f"{path}.error"):
+        write_marker(f"{path}.error", str(error) or type(error).__name__)
+        remove_marker(f"{path}.pending")
+
+
+_executor = None
+
+
+def get_export_executor(renew: bool = False):
+    global _executor
+    if _executor is None or renew:
+        # Spawned, not forked: the web worker has threads running, which a fork would copy mid-flight
+        _executor = ProcessPoolExecutor(max_workers=EXPORT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def is_pending(path: str) -> bool:
+    """
+    True while a render holds the pending marker. A marker older than EXPORT_TIMEOUT was left by a
+    render that died without cleaning up, and no longer counts.
+    """
+    try:
+        return time.time() - os.path.getmtime(f"{path}.pending") < EXPORT_TIMEOUT
+    except FileNotFoundError:
+        return False
+
+
+def claim(path: str) -> bool:
+    """
+    Creates the pending marker for an export. Exclusive across processes: False if another web
+    worker is already rendering it.
+    """
+    pending = f"{path}.pending"
+    if os.path.exists(pending) and not is_pending(path):
+        remove_marker(pending)
+    try:
+        fd = os.open(pending, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w") as f:
+        f.write(str(os.getpid()))
+    return True
+
+
+def export_status(report_id: str, fmt: str) -> str:
+    """
+    "ready", "pending", "failed" or "missing" (never requested). Read from the files in REPORTS_DIR,
+    so every web worker gives the same answer.
+    """
+    path = export_path(report_id, fmt)
+    if os.path.exists(path):
+        return "ready"
+    if is_pending(path):
+        return "pending"
+    if os.path.exists(f"{path}.error"):
+        return "failed"
+    return "missing"
+
+
+def export_error(report_id: str, fmt: str):
+    try:
+        with open(f"{export_path(report_id, fmt)}.error", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def start_export(report_id: str, report: dict, fmt: str) -> str:
+    """
+    Queues the export unless the file exists or is already being rendered by any web worker
+    (a failed one is retried). Returns the export status.
+    """
+    if fmt not in RENDERERS:
+        raise ValueError(f"Unknown export format: {fmt}, expected one of {EXPORT_FORMATS}")
+    path = export_path(report_id, fmt)
+    if os.path.exists(path):
+        return "ready"
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    if claim(path):
+        remove_marker(f"{path}.error")
+        try:
+            try:
+                future = get_export_executor().submit(render_export, report, fmt, path)
+            except BrokenProcessPool:
+                # A worker process died (e.g. killed for memory); start a fresh pool
+                future = get_export_executor(renew=True).submit(render_export, report, fmt, path)
+        except Exception:
+            remove_marker(f"{path}.pending")
+            raise
+        future.add_done_callback(functools.partial(record_failure, path))
+    return export_status(report_id, fmt)
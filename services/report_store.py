@@ -0,0 +1,46 @@
+"""
+Generated reports, stored in REPORTS_DIR (the directory routes/download.py serves) in the
+services.storage format, one <report id>.report file per report.
+
+The id is a hash of the report content, so saving the same report twice writes one file.
+"""
+import os
+import re
+import json
+import hashlib
+from services.storage import write_file, read_file
+
+REPORTS_DIR = os.getenv("REPORTS_DIR", "static/reports")
+REPORT_ID = re.compile(r"^[0-9a-f]{16}$")
+
+
+def report_id(report: dict) -> str:
+    canonical = json.dumps(report, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def report_path(report_id: str) -> str:
+    if not REPORT_ID.match(report_id or ""):
+        raise ValueError(f"Invalid report id: {report_id}")
+    return os.path.join(REPORTS_DIR, f"{report_id}.report")
+
+
+def save_report(report: dict) -> str:
+    """
+    Stores the report unless it is already stored; returns its id.
+    """
+    rid = report_id(report)
+    path = report_path(rid)
+    if not os.path.exists(path):
+        write_file(path, report, "report")
+    return rid
+
+
+def load_report(report_id: str):
+    """
+    Returns the stored report, or None if there is none with that id.
+    """
+    try:
+        return read_file(report_path(report_id), "report")
+    except (ValueError, FileNotFoundError):
+        return None
@@ -0,0 +1,105 @@
+"""
+Typed results for the LLM calls that return JSON.
+
+With STRUCTURED_OUTPUT on (the default), these models are sent to Gemini as the response schema,
+so the model can only answer with a matching JSON object. Responses that still fail validation
+fall back to scraping the text with services.data_parser.
+"""
+import os
+from typing import List, Literal, Optional
+from pydantic import BaseModel, ValidationError
+from services.data_parser import parse_json
+
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "1").lower() in ("1", "true", "yes")
+
+Action = Literal[
+    "report", "clarify_concept", "clarify_company", "clarify_comparison",
+    "recommend", "news_summary", "help", "error",
+]
+
+
+class ActionParameters(BaseModel):
+    """
+    Union of the parameters QUERY_PARSE_INSTRUCTIONS asks for, across every action. The set is closed:
+    the Gemini API rejects response schemas with additionalProperties, so a new parameter must be
+    declared here as well as in the instructions.
+    """
+    concept: Optional[str] = None
+    company: Optional[str] = None
+    question: Optional[str] = None
+    companies: Optional[List[str]] = None
+    metric: Optional[str] = None
+    focus_areas: Optional[List[str]] = None
+    timeframe: Optional[str] = None
+    period: Optional[str] = None
+    risk: Optional[str] = None
+    budget: Optional[float] = None
+    sector: Optional[str] = None
+    time_horizon: Optional[str] = None
+
+
+class ActionRouting(BaseModel):
+    """
+    The query parser's classification of the latest user message.
+    """
+    action: Action
+    company: Optional[str] = None
+    parameters: ActionParameters = ActionParameters()
+
+
+class ReportFactors(BaseModel):
+    """
+    The report factors the intent prompt asks for in structured mode; closed for the same reason as ActionParameters.
+    """
+    company: Optional[str] = None
+    focusAreas: Optional[List[str]] = None
+    timeframe: Optional[str] = None
+    analysisType: Optional[str] = None
+
+
+class ReportIntent(BaseModel):
+    """
+    Whether the user asked for a report, the factors mentioned so far and a follow-up question.
+    """
+    intent: bool = False
+    factors: ReportFactors = ReportFactors()
+    question: Optional[str] = None
+
+
+class SearchQueries(BaseModel):
+    queries: List[str]
+
+
+def validate(schema, value):
+    """
+    Returns value as an instance of schema, or None if it does not match.
+    """
+    if isinstance(value, schema):
+        return value
+    if isinstance(value, list) and "queries" in schema.model_fields:
+        value = {"queries": value}
+    if not isinstance(value, dict):
+        return None
+    try:
+        return schema.model_validate(value)
+    except ValidationError as e:
+        print(f"Response does not match {schema.__name__}: {e}")
+        return None
+
+
+def parse_structured(schema, parsed=None, raw_text=""):
+    """
+    Returns the typed result of a structured call: the SDK-parsed object if there is one,
+    otherwise whatever parse_json can recover from the raw text.
+    """
+    result = validate(schema, parsed) if parsed is not None else None
+    if result is None and raw_text:
+        result = validate(schema, parse_json(raw_text))
+    return result
+
+
+def to_dict(result):
+    """
+    Plain dict of a typed result for the dict-based handlers, without unset fields.
+    """
+    return result.model_dump(exclude_none=True) if result is not None else None
@@ -0,0 +1,206 @@
+"""
+Semantic cache of chat answers.
+
+Answers are stored with the embedding of the standalone query they answered: the contextualised
+message, or for news the search query the news handler refines it into.
+A new question is embedded the same way and, if a stored query of the same action and about the
+same concept or companies is at least SEMANTIC_CACHE_THRESHOLD similar (cosine), its answer is
+returned instead of running the handler: "what is Apple's market cap" and "Apple market cap?"
+share one answer.
+
+Answers go stale at different speeds, so each action has its own time-to-live (ACTION_TTLS,
+overridable with e.g. SEMANTIC_CACHE_TTL_NEWS_SUMMARY=300); actions without one are never cached.
+
+Entries live in a SQLite file under CACHE_DIR, shared by all workers. Each process keeps the
+vectors in memory, one small matrix per (action, entity) partition, and picks up entries written
+by other workers on the next lookup. Lookups are counted in insightz_semantic_cache_total.
+"""
+import os
+import re
+import time
+import sqlite3
+import threading
+import numpy as np
+from services.cache import CACHE_DIR
+from services.metrics import registry, SEMANTIC_CACHE_LOOKUPS
+from services.news_digest import normalise_company
+
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "true").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.92))
+SEMANTIC_CACHE_DB = os.path.join(CACHE_DIR, "semantic_cache.sqlite")
+
+# Concepts do not change; company figures and comparisons move with prices; news moves fastest
+ACTION_TTLS = {
+    "clarify_concept": 7 * 24 * 60 * 60,
+    "clarify_company": 15 * 60,
+    "clarify_comparison": 15 * 60,
+    "news_summary": 10 * 60,
+}
+ACTION_TTLS = {
+    action: float(os.getenv(f"SEMANTIC_CACHE_TTL_{action.upper()}", ttl)) for action, ttl in ACTION_TTLS.items()
+}
+
+
+def partition_key(action: str, action_json: dict) -> str:
+    """
+    Groups entries by action and by the concept or companies asked about, so similar questions about
+    different companies ("Apple market cap" / "Microsoft market cap") never share an answer.
+    """
+    parameters = (action_json or {}).get("parameters") or {}
+    if parameters.get("concept"):
+        entity = re.sub(r"[^a-z0-9]+", " ", parameters["concept"].lower()).strip()
+    else:
+        companies = parameters.get("companies") or [parameters.get("company") or parameters.get("ticker") or ""]
+        entity = ",".join(sorted(normalise_company(company) for company in companies if company))
+    return f"{action}:{entity}"
+
+
+class _Partition:
+    def __init__(self, dim: int):
+        self.ids = []
+        self.vectors = np.empty((0, dim), dtype="float32")
+        self.answers = []
+        self.expires_at = []
+
+    def add(self, entry_id: int, vector: np.ndarray, answer: str, expires_at: float):
+        self.ids.append(entry_id)
+        self.vectors = np.vstack([self.vectors, vector[None, :]])
+        self.answers.append(answer)
+        self.expires_at.append(expires_at)
+
+    def drop_expired(self, now: float):
+        keep = [i for i, expires_at in enumerate(self.expires_at) if expires_at >= now]
+        if len(keep) < len(self.ids):
+            self.ids = [self.ids[i] for i in keep]
+            self.vectors = self.vectors[keep]
+            self.answers = [self.answers[i] for i in keep]
+            self.expires_at = [self.expires_at[i] for i in keep]
+
+    def best(self, vector: np.ndarray):
+        """
+        Returns (similarity, answer) of the closest entry, or (0, None) if empty.
+        Partitions hold a handful of entries, so an exact scan is cheap.
+        """
+        if not self.ids:
+            return 0.0, None
+        scores = self.vectors @ vector
+        i = int(np.argmax(scores))
+        return float(scores[i]), self.answers[i]
+
+
+class SemanticCache:
+
+    def __init__(self, path: str = SEMANTIC_CACHE_DB, embeddings=None, threshold: float = SEMANTIC_CACHE_THRESHOLD, ttls: dict = None):
+        self.path = path
+        self.threshold = threshold
+        self.ttls = ACTION_TTLS if ttls is None else ttls
+        self._embeddings = embeddings
+        self._partitions = {}
+        self._last_id = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # SQLite connections must not be shared with a forked child
+        os.register_at_fork(after_in_child=self._forget_connections)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers (id INTEGER PRIMARY KEY AUTOINCREMENT, partition TEXT, "
+                "query TEXT, vector BLOB, answer TEXT, expires_at REAL)"
+            )
+
+    def _forget_connections(self):
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            # Imported here so the query parser does not load faiss and the embeddings client up front
+            from services.glossary_index import get_embeddings
+            self._embeddings = get_embeddings()
+        return self._embeddings
+
+    def caches(self, action: str) -> bool:
+        return SEMANTIC_CACHE and bool(self.ttls.get(action))
+
+    def embed(self, query: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(" ".join(query.lower().split())), dtype="float32")
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _sync(self):
+        """
+        Loads entries written since the last sync, by this or any other process.
+        """
+        now = time.time()
+        rows = self._connection().execute(
+            "SELECT id, partition, vector, answer, expires_at FROM answers WHERE id > ? AND expires_at >= ? ORDER BY id",
+            (self._last_id, now),
+        ).fetchall()
+        with self._lock:
+            for entry_id, partition, blob, answer, expires_at in rows:
+                if entry_id <= self._last_id:
+                    continue
+                vector = np.frombuffer(blob, dtype="float32")
+                self._partitions.setdefault(partition, _Partition(len(vector))).add(entry_id, vector, answer, expires_at)
+                self._last_id = entry_id
+
+    def get(self, action: str, action_json: dict, query: str):
+        """
+        Returns the stored answer to a similar enough query, or None.
+        """
+        partition = partition_key(action, action_json)
+        vector = self.embed(query)
+        self._sync()
+        with self._lock:
+            entries = self._partitions.get(partition)
+            if entries is None:
+                score, answer = 0.0, None
+            else:
+                entries.drop_expired(time.time())
+                score, answer = entries.best(vector)
+
+        hit = answer is not None and score >= self.threshold
+        registry.inc(SEMANTIC_CACHE_LOOKUPS, action=action, outcome="hit" if hit else "miss")
+        if hit:
+            print(f"[SEMANTIC CACHE] {action} hit ({score:.3f}) for: {query}")
+            return answer
+        return None
+
+    def put(self, action: str, action_json: dict, query: str, answer: str):
+        ttl = self.ttls.get(action)
+        if not ttl or not answer:
+            return
+        vector = self.embed(query)
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute("DELETE FROM answers WHERE expires_at < ?", (now,))
+            conn.execute(
+                "INSERT INTO answers (partition, query, vector, answer, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (partition_key(action, action_json), query, vector.tobytes(), answer, now + ttl),
+            )
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM answers")
+        with self._lock:
+            self._partitions.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache() -> SemanticCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticCache()
+        return _cache
@@ -0,0 +1,78 @@
+"""
+Request coalescing for identical in-flight upstream calls.
+
+group(name).do(key, fn, ...) runs fn once per key at a time: callers arriving while a call with
+the same key is running wait for it and get its result (or its exception) instead of starting
+their own. Nothing is cached; once the call finishes, the next caller runs fn again.
+Shared results are counted in insightz_singleflight_shared_total by group.
+
+Waiters give up after SINGLEFLIGHT_TIMEOUT seconds (default: the gunicorn worker timeout), and a leader
+interrupted by a BaseException (e.g. SystemExit when its worker is stopped) fails its waiters instead of
+handing them an empty result.
+"""
+import copy
+import os
+import threading
+from services.metrics import registry, SINGLEFLIGHT_SHARED
+
+SINGLEFLIGHT_TIMEOUT = float(os.getenv("SINGLEFLIGHT_TIMEOUT", os.getenv("GUNICORN_TIMEOUT", 180)))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+
+    def __init__(self, name: str, timeout: float = SINGLEFLIGHT_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                raise TimeoutError(f"{self.name}: shared call for {key!r} did not finish within {self.timeout:g}s")
+            registry.inc(SINGLEFLIGHT_SHARED, group=self.name)
+            if call.error is not None:
+                raise call.error
+            # Waiters get their own top-level list/dict, so one caller's edits do not leak into another's
+            return copy.copy(call.result)
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        except BaseException as e:
+            call.error = RuntimeError(f"{self.name}: shared call for {key!r} was interrupted ({type(e).__name__})")
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+
+def group(name: str) -> SingleFlight:
+    """
+    Returns the process-wide single-flight group with the given name.
+    """
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
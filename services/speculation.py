@@ -0,0 +1,84 @@
+"""
+Speculative execution of handler steps while the intent is still being parsed.
+
+SPECULATIVE_MODE:
+- off (default): nothing runs ahead of the intent parse
+- refine: the action-independent query refinement (contextualize_user_query) starts alongside the intent parse
+- predict: additionally starts the first step of the handler predicted from the message keywords
+  (currently the news search-query refinement)
+
+Work whose action is not the one finally parsed is discarded; results are counted in
+insightz_speculation_total by task and outcome (hit, miss, error).
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from services.metrics import registry, SPECULATION
+
+SPECULATIVE_MODE = os.getenv("SPECULATIVE_MODE", "off").lower()
+SPECULATIVE_WORKERS = int(os.getenv("SPECULATIVE_WORKERS", "8"))
+
+# Keyword patterns for the cheap action prediction; the first match wins
+PREDICTIONS = [
+    ("news_summary", re.compile(r"\b(news|headlines?|latest|recent|this week|today|sentiment|announce\w*)\b", re.IGNORECASE)),
+]
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        # Created on first use, so gunicorn workers start their own threads after the fork
+        _executor = ThreadPoolExecutor(max_workers=SPECULATIVE_WORKERS, thread_name_prefix="speculation")
+    return _executor
+
+
+def predict_action(message: str):
+    """
+    Returns the action the message most likely maps to, or None if no keyword matches.
+    """
+    for action, pattern in PREDICTIONS:
+        if pattern.search(message or ""):
+            return action
+    return None
+
+
+class Speculation:
+    """
+    Named background tasks started for one request. Handlers take() the result they need;
+    discard() drops everything that was not taken.
+    """
+
+    def __init__(self):
+        self.futures = {}
+
+    def start(self, name: str, fn, *args, **kwargs):
+        self.futures[name] = get_executor().submit(fn, *args, **kwargs)
+
+    def take(self, name: str):
+        """
+        Waits for the named task and returns its result, or None if it was never started or failed.
+        """
+        future = self.futures.pop(name, None)
+        if future is None:
+            return None
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Speculative {name} failed: {e}")
+            registry.inc(SPECULATION, task=name, outcome="error")
+            return None
+        registry.inc(SPECULATION, task=name, outcome="hit")
+        return result
+
+    def discard(self):
+        for name, future in self.futures.items():
+            # Tasks already running finish in the background; their results are dropped
+            future.cancel()
+            registry.inc(SPECULATION, task=name, outcome="miss")
+        self.futures.clear()
+
+
+def taken(speculation, name: str):
+    return speculation.take(name) if speculation is not None else None
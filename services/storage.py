@@ -0,0 +1,171 @@
+"""
+Storage format for persisted reports, chat histories and cached documents.
+
+A stored value is a 5-byte header followed by the payload:
+    b"IZ" | format version | serializer (1 json, 2 msgpack) | compression (0 none, 1 zlib, 2 zstd)
+The payload is [kind, schema version, data], so a reader can tell what it holds and upgrade older
+schemas (see MIGRATIONS). msgpack and zstandard are optional: without them values are written
+as json + zlib, and everything written either way stays readable as long as the library is
+installed. Values without the header are read as plain JSON, so stores written before this
+format keep working.
+
+JSON stays the format of the API: routes decode stored values and return them with jsonify.
+
+    STORAGE_SERIALIZER=msgpack|json     default msgpack if installed
+    STORAGE_COMPRESSION=zstd|zlib|none  default zstd if installed
+"""
+import os
+import json
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b"IZ"
+FORMAT_VERSION = 1
+
+JSON, MSGPACK = 1, 2
+NONE, ZLIB, ZSTD = 0, 1, 2
+SERIALIZERS = {"json": JSON, "msgpack": MSGPACK}
+COMPRESSIONS = {"none": NONE, "zlib": ZLIB, "zstd": ZSTD}
+
+STORAGE_SERIALIZER = SERIALIZERS[os.getenv("STORAGE_SERIALIZER", "msgpack" if msgpack else "json").lower()]
+STORAGE_COMPRESSION = COMPRESSIONS[os.getenv("STORAGE_COMPRESSION", "zstd" if zstandard else "zlib").lower()]
+# Payloads smaller than this are stored uncompressed; compression would not pay for its framing
+STORAGE_MIN_COMPRESS = int(os.getenv("STORAGE_MIN_COMPRESS", 256))
+
+# Current schema version of each kind of value
+SCHEMA_VERSIONS = {
+    "report": 1,
+    "history": 1,
+    "document": 1,
+}
+
+# (kind, version) -> function upgrading data of that version to version + 1
+MIGRATIONS = {}
+
+
+class StorageError(ValueError):
+    """
+    Raised for values that cannot be read: unknown format, missing library or unexpected kind.
+    """
+
+
+def serialize(data, serializer: int) -> bytes:
+    if serializer == MSGPACK:
+        if msgpack is None:
+            raise StorageError("msgpack is not installed")
+        return msgpack.packb(data, use_bin_type=True, default=str)
+    return json.dumps(data, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def deserialize(payload: bytes, serializer: int):
+    if serializer == MSGPACK:
+        if msgpack is None:
+            raise StorageError("Value was written with msgpack, which is not installed")
+        return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+    if serializer == JSON:
+        return json.loads(payload)
+    raise StorageError(f"Unknown serializer {serializer}")
+
+
+def compress(payload: bytes, compression: int) -> bytes:
+    if compression == ZSTD:
+        if zstandard is None:
+            raise StorageError("zstandard is not installed")
+        return zstandard.ZstdCompressor(level=3).compress(payload)
+    if compression == ZLIB:
+        return zlib.compress(payload, 6)
+    return payload
+
+
+def decompress(payload: bytes, compression: int) -> bytes:
+    if compression == ZSTD:
+        if zstandard is None:
+            raise StorageError("Value was compressed with zstd, which is not installed")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    if compression == ZLIB:
+        return zlib.decompress(payload)
+    if compression == NONE:
+        return payload
+    raise StorageError(f"Unknown compression {compression}")
+
+
+def is_encoded(blob: bytes) -> bool:
+    return bytes(blob[:2]) == MAGIC
+
+
+def encode(data, kind: str, serializer: int = None, compression: int = None) -> bytes:
+    """
+    Encodes data of the given kind with the configured serializer and compression.
+    """
+    serializer = serializer or STORAGE_SERIALIZER
+    compression = STORAGE_COMPRESSION if compression is None else compression
+    payload = serialize([kind, SCHEMA_VERSIONS[kind], data], serializer)
+    if len(payload) < STORAGE_MIN_COMPRESS:
+        compression = NONE
+    return MAGIC + bytes([FORMAT_VERSION, serializer, compression]) + compress(payload, compression)
+
+
+def decode(blob: bytes, kind: str):
+    """
+    Decodes a value written by encode() (or plain JSON), upgrading it to the current schema of its kind.
+    """
+    blob = bytes(blob)
+    if not is_encoded(blob):
+        return json.loads(blob)
+    if len(blob) < 5 or blob[2] > FORMAT_VERSION:
+        raise StorageError("Unsupported storage format")
+    stored_kind, version, data = deserialize(decompress(blob[5:], blob[4]), blob[3])
+    if stored_kind != kind:
+        raise StorageError(f"Expected a stored {kind}, found a {stored_kind}")
+    while version < SCHEMA_VERSIONS[kind]:
+        data = MIGRATIONS[(kind, version)](data)
+        version += 1
+    return data
+
+
+def write_file(path: str, data, kind: str):
+    """
+    Writes an encoded value atomically: readers see the old file or the new one, never half of it.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(encode(data, kind))
+    os.replace(tmp_path, path)
+
+
+def read_file(path: str, kind: str):
+    with open(path, "rb") as f:
+        return decode(f.read(), kind)
+
+
+def pack_history(history: list) -> list:
+    """
+    Compacts chat history for storage: {"role": "user", "parts": [{"text": "Hi"}]} -> ["user", "Hi"].
+    Messages without a role or with anything besides text parts are kept as they are.
+    """
+    packed = []
+    for message in history:
+        parts = message.get("parts", [])
+        if (set(message) == {"role", "parts"} and isinstance(message["role"], str) and isinstance(parts, list)
+                and all(isinstance(part, dict) and set(part) == {"text"} for part in parts)):
+            packed.append([message["role"], *(part["text"] for part in parts)])
+        else:
+            packed.append(message)
+    return packed
+
+
+def unpack_history(packed: list) -> list:
+    return [
+        {"role": message[0], "parts": [{"text": text} for text in message[1:]]} if isinstance(message, list) else message
+        for message in packed
+    ]
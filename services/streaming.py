@@ -0,0 +1,131 @@
+"""
+Token streaming for chat responses.
+
+A request that asks for streaming runs its handler on a worker thread with a TokenSink installed
+(see run_streaming). LLM calls that produce the user-facing answer write their text to the
+current sink as it arrives:
+- services.llm.LLM.send_message_with_history(stream=True), through generate_content_stream
+- services.chat_model.ChatModel(stream_to_sink=True), through the langchain streaming path
+
+Everything else (intent parsing, query refinement, agent steps) never writes to the sink.
+The route turns the sink into NDJSON lines or server-sent events, ending with a final event
+that carries the complete message and the query summary.
+"""
+import json
+import queue
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_sink = ContextVar("token_sink", default=None)
+_DONE = object()
+
+
+class TokenSink:
+    """
+    Thread-safe queue of text chunks for one streamed request.
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def put(self, text: str):
+        if text:
+            self.queue.put(text)
+
+    def close(self):
+        self.queue.put(_DONE)
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is _DONE:
+                return
+            yield item
+
+    def writer(self, withhold=()):
+        return SinkWriter(self, withhold)
+
+
+class SinkWriter:
+    """
+    Writes the text of one LLM call to a sink. Text that may still turn out to be one of the
+    withheld sentinel answers (e.g. the concept chain's "No") is held back until it cannot be,
+    and dropped if the whole answer is one.
+    """
+
+    def __init__(self, sink: TokenSink, withhold=()):
+        self.sink = sink
+        self.withhold = tuple(normalise(word) for word in withhold)
+        self.pending = ""
+        self.released = not self.withhold
+
+    def write(self, text: str):
+        if self.released:
+            self.sink.put(text)
+            return
+        self.pending += text
+        current = normalise(self.pending)
+        if not any(word.startswith(current) for word in self.withhold):
+            self.release()
+
+    def finish(self):
+        if not self.released and normalise(self.pending) not in self.withhold:
+            self.release()
+
+    def release(self):
+        self.released = True
+        self.sink.put(self.pending)
+        self.pending = ""
+
+
+def normalise(text: str) -> str:
+    return text.strip().rstrip(".!").lower()
+
+
+def current_sink():
+    return _sink.get()
+
+
+@contextmanager
+def streaming_to(sink: TokenSink):
+    token = _sink.set(sink)
+    try:
+        yield sink
+    finally:
+        _sink.reset(token)
+
+
+def run_streaming(fn, *args, **kwargs):
+    """
+    Runs fn on a worker thread with a token sink installed, yielding ("token", text) events while
+    it runs, then ("final", result) or ("error", message).
+    """
+    sink = TokenSink()
+    outcome = {}
+
+    def work():
+        with streaming_to(sink):
+            try:
+                outcome["result"] = fn(*args, **kwargs)
+            except Exception as e:
+                print(f"Error while streaming response: {e}")
+                outcome["error"] = str(e)
+            finally:
+                sink.close()
+
+    threading.Thread(target=work, name="stream-response", daemon=True).start()
+    for text in sink:
+        yield "token", text
+    if "error" in outcome:
+        yield "error", outcome["error"]
+    else:
+        yield "final", outcome.get("result")
+
+
+def format_ndjson(event: str, data: dict) -> str:
+    return json.dumps({"event": event, **data}, default=str) + "\n"
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
@@ -0,0 +1,34 @@
+import threading
+
+
+class Lazy:
+    """
+    Thread-safe holder that builds its value with the factory on first get().
+    Concurrent callers wait for the one build instead of building their own.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._value = self.factory()
+                    self._loaded = True
+        return self._value
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def reset(self):
+        """
+        Drops the value so the next get() builds a fresh one.
+        """
+        with self._lock:
+            self._value = None
+            self._loaded = False